@@ -73,6 +73,17 @@ write_action_env_to_bazelrc "TF_SHARED_LIBRARY_DIR" ${TF_SHARED_LIBRARY_DIR}
 write_action_env_to_bazelrc "TF_SHARED_LIBRARY_NAME" ${TF_SHARED_LIBRARY_NAME}
 write_action_env_to_bazelrc "TF_CXX11_ABI_FLAG" ${TF_CXX11_ABI_FLAG}
 
+# Opt-in instruction sets for the elementwise and correlation cost kernels,
+# e.g. `bazel build --config=avx2 build_pip_pkg`. Release wheels have to run
+# on any x86-64 host, so none of these are enabled by default.
+VECTORIZED_OPS="tensorflow_addons/custom_ops/(activations|layers)/.*"
+write_to_bazelrc "build:native_arch --per_file_copt=${VECTORIZED_OPS}@-march=native"
+write_to_bazelrc "build:avx2 --per_file_copt=${VECTORIZED_OPS}@-mavx2,-mfma"
+write_to_bazelrc "build:avx512 --config=avx2"
+write_to_bazelrc "build:avx512 --per_file_copt=${VECTORIZED_OPS}@-mavx512f"
+write_to_bazelrc "build:avx512_vnni --config=avx512"
+write_to_bazelrc "build:avx512_vnni --per_file_copt=${VECTORIZED_OPS}@-mavx512vl,-mavx512vnni"
+
 
 if [[ "$TF_NEED_CUDA" == "1" ]]; then
     write_action_env_to_bazelrc "TF_NEED_CUDA" ${TF_NEED_CUDA}
@@ -19,14 +19,10 @@ from __future__ import print_function
 
 import tensorflow as tf
 from tensorflow_addons.utils import keras_utils
-from tensorflow_addons.utils.resource_loader import get_path_to_datafile
-
-_activation_ops_so = tf.load_op_library(
-    get_path_to_datafile("custom_ops/activations/_activation_ops.so"))
 
 
 @keras_utils.register_keras_custom_object
-@tf.function
+@tf.function(experimental_compile=True)
 def mish(x):
     """Mish: A Self Regularized Non-Monotonic Neural Activation Function.
 
@@ -41,9 +37,11 @@ def mish(x):
         A `Tensor`. Has the same type as `x`.
     """
     x = tf.convert_to_tensor(x)
-    return _activation_ops_so.addons_mish(x)
-
-
-@tf.RegisterGradient("Addons>Mish")
-def _mish_grad(op, grad):
-    return _activation_ops_so.addons_mish_grad(grad, op.inputs[0])
+    # float16 overflows in exp(x)**2 well before mish saturates.
+    y = tf.cast(x, tf.float32) if x.dtype == tf.float16 else x
+    # tanh(softplus(y)) == n / (n + 2) with n = e**y * (e**y + 2), which
+    # needs a single exp and stays accurate for large negative inputs.
+    # Clamping avoids inf / inf; the ratio has already saturated to 1 there.
+    e = tf.math.exp(tf.minimum(y, 20.0))
+    n = e * (e + 2.0)
+    return tf.cast(y * n / (n + 2.0), x.dtype)
@@ -36,6 +36,15 @@ class MishTest(tf.test.TestCase, parameterized.TestCase):
             [-0.2525015, -0.30340144, 0.0, 0.86509836, 1.943959], dtype=dtype)
         self.assertAllCloseAccordingToType(mish(x), expected_result)
 
+    @parameterized.named_parameters(("float16", np.float16),
+                                    ("float32", np.float32),
+                                    ("float64", np.float64))
+    def test_large_inputs(self, dtype):
+        x = tf.constant([-100.0, -20.0, 20.0, 100.0], dtype=dtype)
+        expected_result = tf.constant(
+            [-3.7200760e-42, -4.1223073e-08, 20.0, 100.0], dtype=dtype)
+        self.assertAllCloseAccordingToType(mish(x), expected_result)
+
     @parameterized.named_parameters(("float32", np.float32),
                                     ("float64", np.float64))
     def test_theoretical_gradients(self, dtype):
@@ -15,6 +15,9 @@ limitations under the License.
 
 #define EIGEN_USE_THREADS
 
+#include <algorithm>
+#include <type_traits>
+
 #if GOOGLE_CUDA
 #define EIGEN_USE_GPU
 #endif  // GOOGLE_CUDA
@@ -25,6 +28,13 @@ limitations under the License.
 #include "tensorflow/core/framework/types.h"
 #include "tensorflow/core/util/tensor_format.h"
 
+#if defined(__AVX512VNNI__) && defined(__AVX512VL__)
+#include <immintrin.h>
+#endif
+#if defined(__ARM_NEON)
+#include <arm_neon.h>
+#endif
+
 namespace tensorflow {
 namespace addons {
 
@@ -33,6 +43,36 @@ typedef Eigen::GpuDevice GPUDevice;
 
 namespace functor {
 
+namespace {
+
+// Dot product of two vectors, accumulated in float.
+template <typename Dtype>
+inline float DotProduct(const Dtype* a, const Dtype* b, int n) {
+  float sum = 0;
+  for (int i = 0; i < n; ++i) {
+    sum += static_cast<float>(a[i]) * static_cast<float>(b[i]);
+  }
+  return sum;
+}
+
+#if defined(__aarch64__)
+template <>
+inline float DotProduct<float>(const float* a, const float* b, int n) {
+  float32x4_t acc = vdupq_n_f32(0);
+  int i = 0;
+  for (; i + 4 <= n; i += 4) {
+    acc = vfmaq_f32(acc, vld1q_f32(a + i), vld1q_f32(b + i));
+  }
+  float sum = vaddvq_f32(acc);
+  for (; i < n; ++i) {
+    sum += a[i] * b[i];
+  }
+  return sum;
+}
+#endif
+
+}  // namespace
+
 template <typename Dtype>
 struct CorrelationCostFunctor<CPUDevice, Dtype> {
   Status operator()(OpKernelContext* context, const Tensor& input_a_t,
@@ -40,10 +80,10 @@ struct CorrelationCostFunctor<CPUDevice, Dtype> {
                     /* params */
                     int kernel_size, int max_displacement, int stride_1,
                     int stride_2, int pad, TensorFormat data_format) {
-    const int32 oN = GetTensorDim(*output_t, FORMAT_NCHW, 'N');
-    // const int32 oC = GetTensorDim(*output_t, FORMAT_NCHW, 'C');
-    const int32 oH = GetTensorDim(*output_t, FORMAT_NCHW, 'H');
-    const int32 oW = GetTensorDim(*output_t, FORMAT_NCHW, 'W');
+    const int32 oN = GetTensorDim(*output_t, data_format, 'N');
+    // const int32 oC = GetTensorDim(*output_t, data_format, 'C');
+    const int32 oH = GetTensorDim(*output_t, data_format, 'H');
+    const int32 oW = GetTensorDim(*output_t, data_format, 'W');
     const int32 iH = GetTensorDim(input_a_t, data_format, 'H');
     const int32 iW = GetTensorDim(input_a_t, data_format, 'W');
     const int32 iC = GetTensorDim(input_a_t, data_format, 'C');
@@ -53,7 +93,6 @@ struct CorrelationCostFunctor<CPUDevice, Dtype> {
     const auto input_a = input_a_t.tensor<Dtype, 4>();
     const auto input_b = input_b_t.tensor<Dtype, 4>();
     auto output = output_t->tensor<Dtype, 4>();
-    output.setZero();
 
     const int kernel_rad = (kernel_size - 1) / 2;
     const int displacement_rad = max_displacement / stride_2;
@@ -63,9 +102,9 @@ struct CorrelationCostFunctor<CPUDevice, Dtype> {
 
     for (int n = 0; n < oN; ++n) {
       for (int h = 0; h < oH; ++h) {
-        const int h1 = (h - pad) * stride_1 + max_displacement + kernel_rad;
+        const int h1 = h * stride_1 - pad + max_displacement + kernel_rad;
         for (int w = 0; w < oW; ++w) {
-          const int w1 = (w - pad) * stride_1 + max_displacement + kernel_rad;
+          const int w1 = w * stride_1 - pad + max_displacement + kernel_rad;
 
           for (int tj = -displacement_rad; tj <= displacement_rad; ++tj) {
             for (int ti = -displacement_rad; ti <= displacement_rad; ++ti) {
@@ -75,6 +114,8 @@ struct CorrelationCostFunctor<CPUDevice, Dtype> {
               const int w2 = w1 + ti * stride_2;
               const int h2 = h1 + tj * stride_2;
 
+              // accumulate in float for all input types
+              float cost = 0;
               for (int j = -kernel_rad; j <= kernel_rad; ++j) {
                 // out-of-bound test
                 if ((h1 + j < 0) || (h1 + j >= iH)) continue;
@@ -82,20 +123,27 @@ struct CorrelationCostFunctor<CPUDevice, Dtype> {
                 for (int i = -kernel_rad; i <= kernel_rad; ++i) {
                   if ((w1 + i < 0) || (w1 + i >= iW)) continue;
                   if ((w2 + i < 0) || (w2 + i >= iW)) continue;
-                  for (int c = 0; c < iC; ++c) {
-                    // eq. (1) in FlowNet: Learning Optical Flow with
-                    // Convolutional Networks
-                    if (is_NCHW) {
-                      output(n, tc, h, w) += input_a(n, c, h1 + j, w1 + i) *
-                                             input_b(n, c, h2 + j, w2 + i);
-                    } else {
-                      output(n, tc, h, w) += input_a(n, h1 + j, w1 + i, c) *
-                                             input_b(n, h2 + j, w2 + i, c);
+                  // eq. (1) in FlowNet: Learning Optical Flow with
+                  // Convolutional Networks
+                  if (is_NCHW) {
+                    for (int c = 0; c < iC; ++c) {
+                      cost +=
+                          static_cast<float>(input_a(n, c, h1 + j, w1 + i)) *
+                          static_cast<float>(input_b(n, c, h2 + j, w2 + i));
                     }
+                  } else {
+                    // the channels are contiguous in NHWC
+                    cost += DotProduct(&input_a(n, h1 + j, w1 + i, 0),
+                                       &input_b(n, h2 + j, w2 + i, 0), iC);
                   }
                 }
               }
-              output(n, tc, h, w) /= K;
+              // the cost volume has the same format as the inputs
+              if (is_NCHW) {
+                output(n, tc, h, w) = static_cast<Dtype>(cost / K);
+              } else {
+                output(n, h, w, tc) = static_cast<Dtype>(cost / K);
+              }
             }
           }
         }
@@ -118,16 +166,32 @@ struct CorrelationCostGradFunctor<CPUDevice, Dtype> {
     const int32 iH = GetTensorDim(input_a_t, data_format, 'H');
     const int32 iW = GetTensorDim(input_a_t, data_format, 'W');
 
-    // topdiff is NCHW
-    // const int32 oC = GetTensorDim(topdiff_t, FORMAT_NCHW, 'C');
-    const int32 oH = GetTensorDim(topdiff_t, FORMAT_NCHW, 'H');
-    const int32 oW = GetTensorDim(topdiff_t, FORMAT_NCHW, 'W');
+    // const int32 oC = GetTensorDim(topdiff_t, data_format, 'C');
+    const int32 oH = GetTensorDim(topdiff_t, data_format, 'H');
+    const int32 oW = GetTensorDim(topdiff_t, data_format, 'W');
 
     const auto topdiff = topdiff_t.tensor<Dtype, 4>();
     const auto input_a = input_a_t.tensor<Dtype, 4>();
     const auto input_b = input_b_t.tensor<Dtype, 4>();
-    auto output_a_gradient = output_a_gradient_t->tensor<Dtype, 4>();
-    auto output_b_gradient = output_b_gradient_t->tensor<Dtype, 4>();
+
+    // the gradients are accumulated in float for all input types
+    const bool is_float = std::is_same<Dtype, float>::value;
+    Tensor grad_a_t = *output_a_gradient_t;
+    Tensor grad_b_t = *output_b_gradient_t;
+    if (!is_float) {
+      Status s = context->allocate_temp(DT_FLOAT, output_a_gradient_t->shape(),
+                                        &grad_a_t);
+      if (!TF_PREDICT_TRUE(s.ok())) {
+        return s;
+      }
+      s = context->allocate_temp(DT_FLOAT, output_b_gradient_t->shape(),
+                                 &grad_b_t);
+      if (!TF_PREDICT_TRUE(s.ok())) {
+        return s;
+      }
+    }
+    auto output_a_gradient = grad_a_t.tensor<float, 4>();
+    auto output_b_gradient = grad_b_t.tensor<float, 4>();
     output_a_gradient.setZero();
     output_b_gradient.setZero();
 
@@ -140,9 +204,9 @@ struct CorrelationCostGradFunctor<CPUDevice, Dtype> {
 
     for (int n = 0; n < iN; ++n) {
       for (int h = 0; h < oH; ++h) {
-        const int h1 = (h - pad) * stride_1 + max_displacement + kernel_rad;
+        const int h1 = h * stride_1 - pad + max_displacement + kernel_rad;
         for (int w = 0; w < oW; ++w) {
-          const int w1 = (w - pad) * stride_1 + max_displacement + kernel_rad;
+          const int w1 = w * stride_1 - pad + max_displacement + kernel_rad;
 
           for (int tj = -displacement_rad; tj <= displacement_rad; ++tj) {
             for (int ti = -displacement_rad; ti <= displacement_rad; ++ti) {
@@ -152,6 +216,9 @@ struct CorrelationCostGradFunctor<CPUDevice, Dtype> {
               const int w2 = w1 + ti * stride_2;
               const int h2 = h1 + tj * stride_2;
 
+              const Dtype top_diff =
+                  is_NCHW ? topdiff(n, tc, h, w) : topdiff(n, h, w, tc);
+              const float top = static_cast<float>(top_diff) / K;
               for (int j = -kernel_rad; j <= kernel_rad; ++j) {
                 // out-of-bound test
                 if ((h1 + j < 0) || (h1 + j >= iH)) continue;
@@ -163,19 +230,19 @@ struct CorrelationCostGradFunctor<CPUDevice, Dtype> {
                     // eq. (1) in FlowNet: Learning Optical Flow with
                     // Convolutional Networks
                     if (is_NCHW) {
-                      output_a_gradient(n, c, h1 + j, w1 + i) +=
-                          topdiff(n, tc, h, w) * input_b(n, c, h2 + j, w2 + i) /
-                          K;
-                      output_b_gradient(n, c, h2 + j, w2 + i) +=
-                          topdiff(n, tc, h, w) * input_a(n, c, h1 + j, w1 + i) /
-                          K;
+                      const float a =
+                          static_cast<float>(input_a(n, c, h1 + j, w1 + i));
+                      const float b =
+                          static_cast<float>(input_b(n, c, h2 + j, w2 + i));
+                      output_a_gradient(n, c, h1 + j, w1 + i) += top * b;
+                      output_b_gradient(n, c, h2 + j, w2 + i) += top * a;
                     } else {
-                      output_a_gradient(n, h1 + j, w1 + i, c) +=
-                          topdiff(n, tc, h, w) * input_b(n, h2 + j, w2 + i, c) /
-                          K;
-                      output_b_gradient(n, h2 + j, w2 + i, c) +=
-                          topdiff(n, tc, h, w) * input_a(n, h1 + j, w1 + i, c) /
-                          K;
+                      const float a =
+                          static_cast<float>(input_a(n, h1 + j, w1 + i, c));
+                      const float b =
+                          static_cast<float>(input_b(n, h2 + j, w2 + i, c));
+                      output_a_gradient(n, h1 + j, w1 + i, c) += top * b;
+                      output_b_gradient(n, h2 + j, w2 + i, c) += top * a;
                     }
                   }
                 }
@@ -185,6 +252,351 @@ struct CorrelationCostGradFunctor<CPUDevice, Dtype> {
         }
       }
     }
+
+    if (!is_float) {
+      output_a_gradient_t->tensor<Dtype, 4>() =
+          output_a_gradient.template cast<Dtype>();
+      output_b_gradient_t->tensor<Dtype, 4>() =
+          output_b_gradient.template cast<Dtype>();
+    }
+    return Status::OK();
+  }
+};
+
+namespace {
+
+// Copies `input_t` into the zero-padded NHWC `padded_t`.
+template <typename Dtype>
+void PadInput(const Tensor& input_t, Tensor* padded_t, int pad,
+              TensorFormat data_format) {
+  const int32 iN = GetTensorDim(input_t, data_format, 'N');
+  const int32 iC = GetTensorDim(input_t, data_format, 'C');
+  const int32 iH = GetTensorDim(input_t, data_format, 'H');
+  const int32 iW = GetTensorDim(input_t, data_format, 'W');
+  const int32 pH = iH + 2 * pad;
+  const int32 pW = iW + 2 * pad;
+
+  const Dtype* input = input_t.flat<Dtype>().data();
+  Dtype* padded = padded_t->flat<Dtype>().data();
+  std::fill(padded, padded + padded_t->NumElements(), Dtype(0));
+
+  const bool is_NCHW = (data_format == FORMAT_NCHW);
+
+  for (int n = 0; n < iN; ++n) {
+    for (int h = 0; h < iH; ++h) {
+      Dtype* row = padded + ((n * pH + h + pad) * pW + pad) * iC;
+      if (is_NCHW) {
+        for (int c = 0; c < iC; ++c) {
+          const Dtype* in = input + ((n * iC + c) * iH + h) * iW;
+          for (int w = 0; w < iW; ++w) {
+            row[w * iC + c] = in[w];
+          }
+        }
+      } else {
+        const Dtype* in = input + (n * iH + h) * iW * iC;
+        std::copy(in, in + iW * iC, row);
+      }
+    }
+  }
+}
+
+// Inverse of PadInput for the float gradients of the padded inputs, which
+// are cast to Dtype.
+template <typename Dtype>
+void UnpadGradient(const Tensor& padded_t, Tensor* input_t, int pad,
+                   TensorFormat data_format) {
+  const int32 iN = GetTensorDim(*input_t, data_format, 'N');
+  const int32 iC = GetTensorDim(*input_t, data_format, 'C');
+  const int32 iH = GetTensorDim(*input_t, data_format, 'H');
+  const int32 iW = GetTensorDim(*input_t, data_format, 'W');
+  const int32 pH = iH + 2 * pad;
+  const int32 pW = iW + 2 * pad;
+
+  const float* padded = padded_t.flat<float>().data();
+  Dtype* input = input_t->flat<Dtype>().data();
+
+  const bool is_NCHW = (data_format == FORMAT_NCHW);
+
+  for (int n = 0; n < iN; ++n) {
+    for (int h = 0; h < iH; ++h) {
+      const float* row = padded + ((n * pH + h + pad) * pW + pad) * iC;
+      if (is_NCHW) {
+        for (int c = 0; c < iC; ++c) {
+          Dtype* out = input + ((n * iC + c) * iH + h) * iW;
+          for (int w = 0; w < iW; ++w) {
+            out[w] = static_cast<Dtype>(row[w * iC + c]);
+          }
+        }
+      } else {
+        Dtype* out = input + (n * iH + h) * iW * iC;
+        for (int x = 0; x < iW * iC; ++x) {
+          out[x] = static_cast<Dtype>(row[x]);
+        }
+      }
+    }
+  }
+}
+
+// Dot product of two int8 vectors with values in [-127, 127].
+inline int32 DotProductInt8(const int8* a, const int8* b, int n) {
+  int32 sum = 0;
+  int i = 0;
+#if defined(__AVX512VNNI__) && defined(__AVX512VL__)
+  // vpdpbusd multiplies unsigned with signed bytes, so the sign of a is
+  // moved onto b. This is why -128 is not a valid input.
+  __m256i acc = _mm256_setzero_si256();
+  for (; i + 32 <= n; i += 32) {
+    const __m256i va =
+        _mm256_loadu_si256(reinterpret_cast<const __m256i*>(a + i));
+    const __m256i vb =
+        _mm256_loadu_si256(reinterpret_cast<const __m256i*>(b + i));
+    acc =
+        _mm256_dpbusd_epi32(acc, _mm256_abs_epi8(va), _mm256_sign_epi8(vb, va));
+  }
+  __m128i acc128 = _mm_add_epi32(_mm256_castsi256_si128(acc),
+                                 _mm256_extracti128_si256(acc, 1));
+  acc128 = _mm_add_epi32(acc128, _mm_shuffle_epi32(acc128, 0x4e));
+  acc128 = _mm_add_epi32(acc128, _mm_shuffle_epi32(acc128, 0xb1));
+  sum = _mm_cvtsi128_si32(acc128);
+#elif defined(__ARM_FEATURE_DOTPROD)
+  int32x4_t acc = vdupq_n_s32(0);
+  for (; i + 16 <= n; i += 16) {
+    acc = vdotq_s32(acc, vld1q_s8(a + i), vld1q_s8(b + i));
+  }
+  sum = vaddvq_s32(acc);
+#endif
+  for (; i < n; ++i) {
+    sum += static_cast<int32>(a[i]) * static_cast<int32>(b[i]);
+  }
+  return sum;
+}
+
+}  // namespace
+
+// The fused CPU kernels work on the padded NHWC inputs, where every row of
+// a patch is one contiguous vector of kernel_size * iC values and no bounds
+// checks are needed.
+template <typename Dtype>
+struct CorrelationCostFusedFunctor<CPUDevice, Dtype> {
+  Status operator()(OpKernelContext* context, const Tensor& input_a_t,
+                    const Tensor& input_b_t, Tensor* output_t,
+                    Tensor* padded_a_t, Tensor* padded_b_t,
+                    /* params */
+                    int kernel_size, int max_displacement, int stride_1,
+                    int stride_2, int pad, TensorFormat data_format) {
+    PadInput<Dtype>(input_a_t, padded_a_t, pad, data_format);
+    PadInput<Dtype>(input_b_t, padded_b_t, pad, data_format);
+
+    const int32 oN = GetTensorDim(*output_t, data_format, 'N');
+    const int32 oH = GetTensorDim(*output_t, data_format, 'H');
+    const int32 oW = GetTensorDim(*output_t, data_format, 'W');
+    const int32 pH = padded_a_t->dim_size(1);
+    const int32 pW = padded_a_t->dim_size(2);
+    const int32 iC = padded_a_t->dim_size(3);
+
+    const Dtype* padded_a = padded_a_t->flat<Dtype>().data();
+    const Dtype* padded_b = padded_b_t->flat<Dtype>().data();
+    auto output = output_t->tensor<Dtype, 4>();
+
+    const int displacement_rad = max_displacement / stride_2;
+    const int displacement_size = 2 * displacement_rad + 1;
+    const int patch_row = kernel_size * iC;
+    const int K = kernel_size * kernel_size * iC;
+
+    const bool is_NCHW = (data_format == FORMAT_NCHW);
+
+    for (int n = 0; n < oN; ++n) {
+      for (int h = 0; h < oH; ++h) {
+        // top-left corner of the patch in the padded input
+        const int h1 = h * stride_1 + max_displacement;
+        for (int w = 0; w < oW; ++w) {
+          const int w1 = w * stride_1 + max_displacement;
+
+          for (int tj = -displacement_rad; tj <= displacement_rad; ++tj) {
+            for (int ti = -displacement_rad; ti <= displacement_rad; ++ti) {
+              const int tc = (tj + displacement_rad) * displacement_size +
+                             (ti + displacement_rad);
+
+              const int w2 = w1 + ti * stride_2;
+              const int h2 = h1 + tj * stride_2;
+
+              float cost = 0;
+              for (int j = 0; j < kernel_size; ++j) {
+                const Dtype* a = padded_a + ((n * pH + h1 + j) * pW + w1) * iC;
+                const Dtype* b = padded_b + ((n * pH + h2 + j) * pW + w2) * iC;
+                cost += DotProduct(a, b, patch_row);
+              }
+              if (is_NCHW) {
+                output(n, tc, h, w) = static_cast<Dtype>(cost / K);
+              } else {
+                output(n, h, w, tc) = static_cast<Dtype>(cost / K);
+              }
+            }
+          }
+        }
+      }
+    }
+    return Status::OK();
+  }
+};
+
+template <typename Dtype>
+struct CorrelationCostFusedGradFunctor<CPUDevice, Dtype> {
+  Status operator()(OpKernelContext* context, const Tensor& padded_a_t,
+                    const Tensor& padded_b_t, const Tensor& topdiff_t,
+                    Tensor* output_a_gradient_t, Tensor* output_b_gradient_t,
+                    /* params */
+                    int kernel_size, int max_displacement, int stride_1,
+                    int stride_2, int pad, TensorFormat data_format) {
+    const int32 iN = padded_a_t.dim_size(0);
+    const int32 pH = padded_a_t.dim_size(1);
+    const int32 pW = padded_a_t.dim_size(2);
+    const int32 iC = padded_a_t.dim_size(3);
+    const int32 oH = GetTensorDim(topdiff_t, data_format, 'H');
+    const int32 oW = GetTensorDim(topdiff_t, data_format, 'W');
+
+    // the gradients of the padded inputs are accumulated in float
+    Tensor grad_a_t;
+    Status s = context->allocate_temp(DT_FLOAT, padded_a_t.shape(), &grad_a_t);
+    if (!TF_PREDICT_TRUE(s.ok())) {
+      return s;
+    }
+    Tensor grad_b_t;
+    s = context->allocate_temp(DT_FLOAT, padded_b_t.shape(), &grad_b_t);
+    if (!TF_PREDICT_TRUE(s.ok())) {
+      return s;
+    }
+    float* grad_a = grad_a_t.flat<float>().data();
+    float* grad_b = grad_b_t.flat<float>().data();
+    std::fill(grad_a, grad_a + grad_a_t.NumElements(), 0.f);
+    std::fill(grad_b, grad_b + grad_b_t.NumElements(), 0.f);
+
+    const Dtype* padded_a = padded_a_t.flat<Dtype>().data();
+    const Dtype* padded_b = padded_b_t.flat<Dtype>().data();
+    const auto topdiff = topdiff_t.tensor<Dtype, 4>();
+
+    const int displacement_rad = max_displacement / stride_2;
+    const int displacement_size = 2 * displacement_rad + 1;
+    const int patch_row = kernel_size * iC;
+    const int K = kernel_size * kernel_size * iC;
+
+    const bool is_NCHW = (data_format == FORMAT_NCHW);
+
+    for (int n = 0; n < iN; ++n) {
+      for (int h = 0; h < oH; ++h) {
+        // top-left corner of the patch in the padded input
+        const int h1 = h * stride_1 + max_displacement;
+        for (int w = 0; w < oW; ++w) {
+          const int w1 = w * stride_1 + max_displacement;
+
+          for (int tj = -displacement_rad; tj <= displacement_rad; ++tj) {
+            for (int ti = -displacement_rad; ti <= displacement_rad; ++ti) {
+              const int tc = (tj + displacement_rad) * displacement_size +
+                             (ti + displacement_rad);
+
+              const int w2 = w1 + ti * stride_2;
+              const int h2 = h1 + tj * stride_2;
+
+              const Dtype top_diff =
+                  is_NCHW ? topdiff(n, tc, h, w) : topdiff(n, h, w, tc);
+              const float top = static_cast<float>(top_diff) / K;
+              for (int j = 0; j < kernel_size; ++j) {
+                const int offset_a = ((n * pH + h1 + j) * pW + w1) * iC;
+                const int offset_b = ((n * pH + h2 + j) * pW + w2) * iC;
+                for (int x = 0; x < patch_row; ++x) {
+                  grad_a[offset_a + x] +=
+                      top * static_cast<float>(padded_b[offset_b + x]);
+                  grad_b[offset_b + x] +=
+                      top * static_cast<float>(padded_a[offset_a + x]);
+                }
+              }
+            }
+          }
+        }
+      }
+    }
+
+    UnpadGradient<Dtype>(grad_a_t, output_a_gradient_t, pad, data_format);
+    UnpadGradient<Dtype>(grad_b_t, output_b_gradient_t, pad, data_format);
+    return Status::OK();
+  }
+};
+
+template <>
+struct CorrelationCostQuantizedFunctor<CPUDevice> {
+  Status operator()(OpKernelContext* context, const Tensor& input_a_t,
+                    const Tensor& input_b_t, float scale_a, float scale_b,
+                    Tensor* output_t,
+                    /* params */
+                    int kernel_size, int max_displacement, int stride_1,
+                    int stride_2, int pad, TensorFormat data_format) {
+    const int32 oN = GetTensorDim(*output_t, data_format, 'N');
+    const int32 oH = GetTensorDim(*output_t, data_format, 'H');
+    const int32 oW = GetTensorDim(*output_t, data_format, 'W');
+    const int32 iH = GetTensorDim(input_a_t, data_format, 'H');
+    const int32 iW = GetTensorDim(input_a_t, data_format, 'W');
+    const int32 iC = GetTensorDim(input_a_t, data_format, 'C');
+
+    // Zero-padded NHWC copies make every row of a patch one contiguous
+    // vector of kernel_size * iC values and remove the bounds checks.
+    const int32 pH = iH + 2 * pad;
+    const int32 pW = iW + 2 * pad;
+    const TensorShape padded_shape({oN, pH, pW, iC});
+    Tensor padded_a_t;
+    Status s = context->allocate_temp(DT_INT8, padded_shape, &padded_a_t);
+    if (!TF_PREDICT_TRUE(s.ok())) {
+      return s;
+    }
+    Tensor padded_b_t;
+    s = context->allocate_temp(DT_INT8, padded_shape, &padded_b_t);
+    if (!TF_PREDICT_TRUE(s.ok())) {
+      return s;
+    }
+    PadInput<int8>(input_a_t, &padded_a_t, pad, data_format);
+    PadInput<int8>(input_b_t, &padded_b_t, pad, data_format);
+
+    const int8* padded_a = padded_a_t.flat<int8>().data();
+    const int8* padded_b = padded_b_t.flat<int8>().data();
+    auto output = output_t->tensor<float, 4>();
+
+    const int displacement_rad = max_displacement / stride_2;
+    const int displacement_size = 2 * displacement_rad + 1;
+    const int patch_row = kernel_size * iC;
+    const float scale = scale_a * scale_b / (kernel_size * kernel_size * iC);
+
+    const bool is_NCHW = (data_format == FORMAT_NCHW);
+
+    for (int n = 0; n < oN; ++n) {
+      for (int h = 0; h < oH; ++h) {
+        // top-left corner of the patch in the padded input
+        const int h1 = h * stride_1 + max_displacement;
+        for (int w = 0; w < oW; ++w) {
+          const int w1 = w * stride_1 + max_displacement;
+
+          for (int tj = -displacement_rad; tj <= displacement_rad; ++tj) {
+            for (int ti = -displacement_rad; ti <= displacement_rad; ++ti) {
+              const int tc = (tj + displacement_rad) * displacement_size +
+                             (ti + displacement_rad);
+
+              const int w2 = w1 + ti * stride_2;
+              const int h2 = h1 + tj * stride_2;
+
+              int32 cost = 0;
+              for (int j = 0; j < kernel_size; ++j) {
+                const int8* a = padded_a + ((n * pH + h1 + j) * pW + w1) * iC;
+                const int8* b = padded_b + ((n * pH + h2 + j) * pW + w2) * iC;
+                cost += DotProductInt8(a, b, patch_row);
+              }
+              if (is_NCHW) {
+                output(n, tc, h, w) = cost * scale;
+              } else {
+                output(n, h, w, tc) = cost * scale;
+              }
+            }
+          }
+        }
+      }
+    }
     return Status::OK();
   }
 };
@@ -244,14 +656,36 @@ class CorrelationCostOp : public OpKernel {
 
     Tensor* output_t;
     OP_REQUIRES_OK(
-        context, context->allocate_output(0, TensorShape({N, Cout, Hout, Wout}),
-                                          &output_t));
+        context,
+        context->allocate_output(
+            0, ShapeFromFormat(data_format_, N, Hout, Wout, Cout), &output_t));
+
+    if (context->num_outputs() == 1) {
+      functor::CorrelationCostFunctor<Device, T> correlationCostFunc;
+      Status s = correlationCostFunc(context, input_a_t, input_b_t, output_t,
+                                     /* params */
+                                     kernel_size, max_displacement, stride_1,
+                                     stride_2, pad, data_format_);
+
+      OP_REQUIRES_OK(context, s);
+      return;
+    }
 
-    functor::CorrelationCostFunctor<Device, T> correlationCostFunc;
-    Status s = correlationCostFunc(context, input_a_t, input_b_t, output_t,
-                                   /* params */
-                                   kernel_size, max_displacement, stride_1,
-                                   stride_2, pad, data_format_);
+    // Addons>CorrelationCostFused also returns the padded inputs
+    const int32 C = GetTensorDim(input_a_t, data_format_, 'C');
+    const TensorShape padded_shape({N, H + 2 * pad, W + 2 * pad, C});
+    Tensor* padded_a_t;
+    OP_REQUIRES_OK(context,
+                   context->allocate_output(1, padded_shape, &padded_a_t));
+    Tensor* padded_b_t;
+    OP_REQUIRES_OK(context,
+                   context->allocate_output(2, padded_shape, &padded_b_t));
+
+    functor::CorrelationCostFusedFunctor<Device, T> correlationCostFunc;
+    Status s = correlationCostFunc(
+        context, input_a_t, input_b_t, output_t, padded_a_t, padded_b_t,
+        /* params */
+        kernel_size, max_displacement, stride_1, stride_2, pad, data_format_);
 
     OP_REQUIRES_OK(context, s);
   }
@@ -319,34 +753,200 @@ class CorrelationCostGradOp : public OpKernel {
   TensorFormat data_format_;
 };
 
+template <typename Device, typename T>
+class CorrelationCostFusedGradOp : public OpKernel {
+ public:
+  explicit CorrelationCostFusedGradOp(OpKernelConstruction* context)
+      : OpKernel(context) {
+    OP_REQUIRES_OK(context, context->GetAttr("kernel_size", &kernel_size));
+    OP_REQUIRES_OK(context,
+                   context->GetAttr("max_displacement", &max_displacement));
+    OP_REQUIRES_OK(context, context->GetAttr("stride_1", &stride_1));
+    OP_REQUIRES_OK(context, context->GetAttr("stride_2", &stride_2));
+    OP_REQUIRES_OK(context, context->GetAttr("pad", &pad));
+    string data_format;
+    OP_REQUIRES_OK(context, context->GetAttr("data_format", &data_format));
+    OP_REQUIRES(context, FormatFromString(data_format, &data_format_),
+                errors::InvalidArgument("Invalid data format"));
+    OP_REQUIRES(context, kernel_size % 2 != 0,
+                errors::InvalidArgument("kernel_size must be odd"));
+  }
+
+  void Compute(OpKernelContext* context) override {
+    const Tensor& padded_a_t = context->input(0);
+    const Tensor& padded_b_t = context->input(1);
+    const Tensor& topdiff_t = context->input(2);
+
+    OP_REQUIRES(context, padded_a_t.shape() == padded_b_t.shape(),
+                errors::InvalidArgument("Input shapes have to be the same"));
+    OP_REQUIRES(context, padded_a_t.dims() == 4,
+                errors::InvalidArgument("Padded inputs must be 4-D"));
+
+    // the padded inputs are NHWC
+    const int32 N = padded_a_t.dim_size(0);
+    const int32 H = padded_a_t.dim_size(1) - 2 * pad;
+    const int32 W = padded_a_t.dim_size(2) - 2 * pad;
+    const int32 C = padded_a_t.dim_size(3);
+    const TensorShape input_shape = ShapeFromFormat(data_format_, N, H, W, C);
+
+    // Allocate the memory for the bottom diffs
+    Tensor* output_a_gradient_t;
+    OP_REQUIRES_OK(context, context->allocate_output(0, input_shape,
+                                                     &output_a_gradient_t));
+    Tensor* output_b_gradient_t;
+    OP_REQUIRES_OK(context, context->allocate_output(1, input_shape,
+                                                     &output_b_gradient_t));
+
+    functor::CorrelationCostFusedGradFunctor<Device, T> correlationCostGrad;
+    Status s = correlationCostGrad(context, padded_a_t, padded_b_t, topdiff_t,
+                                   output_a_gradient_t, output_b_gradient_t,
+                                   /* params */
+                                   kernel_size, max_displacement, stride_1,
+                                   stride_2, pad, data_format_);
+
+    OP_REQUIRES_OK(context, s);
+  }
+
+ private:
+  int kernel_size;
+  int max_displacement;
+  int stride_1;
+  int stride_2;
+  int pad;
+  TensorFormat data_format_;
+};
+
+class CorrelationCostQuantizedOp : public OpKernel {
+ public:
+  explicit CorrelationCostQuantizedOp(OpKernelConstruction* context)
+      : OpKernel(context) {
+    OP_REQUIRES_OK(context, context->GetAttr("kernel_size", &kernel_size));
+    OP_REQUIRES_OK(context,
+                   context->GetAttr("max_displacement", &max_displacement));
+    OP_REQUIRES_OK(context, context->GetAttr("stride_1", &stride_1));
+    OP_REQUIRES_OK(context, context->GetAttr("stride_2", &stride_2));
+    OP_REQUIRES_OK(context, context->GetAttr("pad", &pad));
+    string data_format;
+    OP_REQUIRES_OK(context, context->GetAttr("data_format", &data_format));
+    OP_REQUIRES(context, FormatFromString(data_format, &data_format_),
+                errors::InvalidArgument("Invalid data format"));
+    OP_REQUIRES(context, kernel_size % 2 != 0,
+                errors::InvalidArgument("kernel_size must be odd"));
+  }
+
+  void Compute(OpKernelContext* context) override {
+    const Tensor& input_a_t = context->input(0);
+    const Tensor& input_b_t = context->input(1);
+    const Tensor& scale_a_t = context->input(2);
+    const Tensor& scale_b_t = context->input(3);
+
+    OP_REQUIRES(context, input_a_t.shape() == input_b_t.shape(),
+                errors::InvalidArgument("Input shapes have to be the same"));
+    OP_REQUIRES(context,
+                TensorShapeUtils::IsScalar(scale_a_t.shape()) &&
+                    TensorShapeUtils::IsScalar(scale_b_t.shape()),
+                errors::InvalidArgument("Scales have to be scalars"));
+
+    const int32 N = GetTensorDim(input_a_t, data_format_, 'N');
+    const int32 H = GetTensorDim(input_a_t, data_format_, 'H');
+    const int32 W = GetTensorDim(input_a_t, data_format_, 'W');
+
+    // output channels are d**2 where, d = 2r + 1
+    const int32 r = max_displacement / stride_2;
+    const int32 d = 2 * r + 1;
+    const int32 border = max_displacement + (kernel_size - 1) / 2;
+
+    const int32 Cout = d * d;
+    const int32 Hout =
+        static_cast<int>(ceil(static_cast<float>(((H + 2 * pad) - border * 2)) /
+                              static_cast<float>(stride_1)));
+    const int32 Wout =
+        static_cast<int>(ceil(static_cast<float>(((W + 2 * pad) - border * 2)) /
+                              static_cast<float>(stride_1)));
+
+    OP_REQUIRES(context, Hout >= 1,
+                errors::InvalidArgument(
+                    "Neighborhood and kernel don't fit in input height."));
+    OP_REQUIRES(context, Wout >= 1,
+                errors::InvalidArgument(
+                    "Neighborhood and kernel don't fit in input width."));
+
+    Tensor* output_t;
+    OP_REQUIRES_OK(
+        context,
+        context->allocate_output(
+            0, ShapeFromFormat(data_format_, N, Hout, Wout, Cout), &output_t));
+
+    functor::CorrelationCostQuantizedFunctor<CPUDevice> correlationCostFunc;
+    Status s = correlationCostFunc(
+        context, input_a_t, input_b_t, scale_a_t.scalar<float>()(),
+        scale_b_t.scalar<float>()(), output_t,
+        /* params */
+        kernel_size, max_displacement, stride_1, stride_2, pad, data_format_);
+
+    OP_REQUIRES_OK(context, s);
+  }
+
+ private:
+  int kernel_size;
+  int max_displacement;
+  int stride_1;
+  int stride_2;
+  int pad;
+  TensorFormat data_format_;
+};
+
 // Register the CPU kernels.
-#define REGISTER_CORRELATIONCOST_OP_CPU(T)                   \
-  REGISTER_KERNEL_BUILDER(Name("Addons>CorrelationCost")     \
-                              .Device(DEVICE_CPU)            \
-                              .TypeConstraint<T>("T"),       \
-                          CorrelationCostOp<CPUDevice, T>)   \
-  REGISTER_KERNEL_BUILDER(Name("Addons>CorrelationCostGrad") \
-                              .Device(DEVICE_CPU)            \
-                              .TypeConstraint<T>("T"),       \
-                          CorrelationCostGradOp<CPUDevice, T>)
+#define REGISTER_CORRELATIONCOST_OP_CPU(T)                        \
+  REGISTER_KERNEL_BUILDER(Name("Addons>CorrelationCost")          \
+                              .Device(DEVICE_CPU)                 \
+                              .TypeConstraint<T>("T"),            \
+                          CorrelationCostOp<CPUDevice, T>)        \
+  REGISTER_KERNEL_BUILDER(Name("Addons>CorrelationCostGrad")      \
+                              .Device(DEVICE_CPU)                 \
+                              .TypeConstraint<T>("T"),            \
+                          CorrelationCostGradOp<CPUDevice, T>)    \
+  REGISTER_KERNEL_BUILDER(Name("Addons>CorrelationCostFused")     \
+                              .Device(DEVICE_CPU)                 \
+                              .TypeConstraint<T>("T"),            \
+                          CorrelationCostOp<CPUDevice, T>)        \
+  REGISTER_KERNEL_BUILDER(Name("Addons>CorrelationCostFusedGrad") \
+                              .Device(DEVICE_CPU)                 \
+                              .TypeConstraint<T>("T"),            \
+                          CorrelationCostFusedGradOp<CPUDevice, T>)
 
 TF_CALL_float(REGISTER_CORRELATIONCOST_OP_CPU);
+TF_CALL_half(REGISTER_CORRELATIONCOST_OP_CPU);
+TF_CALL_bfloat16(REGISTER_CORRELATIONCOST_OP_CPU);
 #undef REGISTER_CORRELATIONCOST_OP_CPU
 
+REGISTER_KERNEL_BUILDER(
+    Name("Addons>CorrelationCostQuantized").Device(DEVICE_CPU),
+    CorrelationCostQuantizedOp);
+
 // Register the GPU kernels.
 #if GOOGLE_CUDA
 
-#define REGISTER_CORRELATIONCOST_OP_GPU(T)                   \
-  REGISTER_KERNEL_BUILDER(Name("Addons>CorrelationCost")     \
-                              .Device(DEVICE_GPU)            \
-                              .TypeConstraint<T>("T"),       \
-                          CorrelationCostOp<GPUDevice, T>)   \
-  REGISTER_KERNEL_BUILDER(Name("Addons>CorrelationCostGrad") \
-                              .Device(DEVICE_GPU)            \
-                              .TypeConstraint<T>("T"),       \
-                          CorrelationCostGradOp<GPUDevice, T>)
+#define REGISTER_CORRELATIONCOST_OP_GPU(T)                        \
+  REGISTER_KERNEL_BUILDER(Name("Addons>CorrelationCost")          \
+                              .Device(DEVICE_GPU)                 \
+                              .TypeConstraint<T>("T"),            \
+                          CorrelationCostOp<GPUDevice, T>)        \
+  REGISTER_KERNEL_BUILDER(Name("Addons>CorrelationCostGrad")      \
+                              .Device(DEVICE_GPU)                 \
+                              .TypeConstraint<T>("T"),            \
+                          CorrelationCostGradOp<GPUDevice, T>)    \
+  REGISTER_KERNEL_BUILDER(Name("Addons>CorrelationCostFused")     \
+                              .Device(DEVICE_GPU)                 \
+                              .TypeConstraint<T>("T"),            \
+                          CorrelationCostOp<GPUDevice, T>)        \
+  REGISTER_KERNEL_BUILDER(Name("Addons>CorrelationCostFusedGrad") \
+                              .Device(DEVICE_GPU)                 \
+                              .TypeConstraint<T>("T"),            \
+                          CorrelationCostFusedGradOp<GPUDevice, T>)
 
 TF_CALL_float(REGISTER_CORRELATIONCOST_OP_GPU);
+TF_CALL_half(REGISTER_CORRELATIONCOST_OP_GPU);
 #undef REGISTER_CORRELATIONCOST_OP_GPU
 
 #endif  // GOOGLE_CUDA
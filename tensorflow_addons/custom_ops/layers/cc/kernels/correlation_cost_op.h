@@ -42,6 +42,42 @@ struct CorrelationCostGradFunctor {
                     int stride_2, int pad, TensorFormat data_format);
 };
 
+// Same as CorrelationCostFunctor, but also returns the zero-padded NHWC
+// copies of both inputs, so the gradient does not have to rebuild them.
+template <typename Device, typename T>
+struct CorrelationCostFusedFunctor {
+  Status operator()(OpKernelContext* context, const Tensor& input_a_t,
+                    const Tensor& input_b_t, Tensor* output_t,
+                    Tensor* padded_a_t, Tensor* padded_b_t,
+                    /* params */
+                    int kernel_size, int max_displacement, int stride_1,
+                    int stride_2, int pad, TensorFormat data_format);
+};
+
+// Same as CorrelationCostGradFunctor, but consumes the padded inputs
+// returned by CorrelationCostFusedFunctor.
+template <typename Device, typename T>
+struct CorrelationCostFusedGradFunctor {
+  Status operator()(OpKernelContext* context, const Tensor& padded_a_t,
+                    const Tensor& padded_b_t, const Tensor& topdiff_t,
+                    Tensor* output_a_gradient_t, Tensor* output_b_gradient_t,
+                    /* params */
+                    int kernel_size, int max_displacement, int stride_1,
+                    int stride_2, int pad, TensorFormat data_format);
+};
+
+// Correlation costs of int8 inputs, dequantized with the product of the
+// two scales. Only implemented on CPU.
+template <typename Device>
+struct CorrelationCostQuantizedFunctor {
+  Status operator()(OpKernelContext* context, const Tensor& input_a_t,
+                    const Tensor& input_b_t, float scale_a, float scale_b,
+                    Tensor* output_t,
+                    /* params */
+                    int kernel_size, int max_displacement, int stride_1,
+                    int stride_2, int pad, TensorFormat data_format);
+};
+
 }  // namespace functor
 }  // namespace addons
 }  // namespace tensorflow
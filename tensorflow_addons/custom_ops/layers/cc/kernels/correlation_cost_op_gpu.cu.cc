@@ -17,6 +17,8 @@ limitations under the License.
 
 #define EIGEN_USE_GPU
 
+#include <algorithm>
+
 #include "tensorflow_addons/custom_ops/layers/cc/kernels/correlation_cost_op.h"
 #include "gpu/cub/device/device_reduce.cuh"
 #include "tensorflow/core/framework/tensor.h"
@@ -40,8 +42,8 @@ This implementation is inspired from
 https://github.com/NVIDIA/flownet2-pytorch
 */
 
-template <unsigned int THREADS_PER_BLOCK>
-__global__ void pad_and_transpose(const float *input, float *output, int C,
+template <typename Dtype, unsigned int THREADS_PER_BLOCK>
+__global__ void pad_and_transpose(const Dtype *input, Dtype *output, int C,
                                   int H, int W, int P) {
   // NCHW -> pad(NHWC)
   const int n = blockIdx.x;
@@ -51,15 +53,15 @@ __global__ void pad_and_transpose(const float *input, float *output, int C,
   const int pW = (W + 2 * P);
   const int pH = (H + 2 * P);
 
-  float value;
+  Dtype value;
   for (int c = c0; c < C; c += THREADS_PER_BLOCK) {
     value = input[n * (C * H * W) + c * (H * W) + h * W + w];
     output[n * (C * pH * pW) + (h + P) * (pW * C) + (w + P) * C + c] = value;
   }
 }
 
-template <unsigned int THREADS_PER_BLOCK>
-__global__ void pad_and_no_transpose(const float *input, float *output, int C,
+template <typename Dtype, unsigned int THREADS_PER_BLOCK>
+__global__ void pad_and_no_transpose(const Dtype *input, Dtype *output, int C,
                                      int H, int W, int P) {
   // NHWC -> pad(NHWC)
   const int n = blockIdx.x;
@@ -69,19 +71,20 @@ __global__ void pad_and_no_transpose(const float *input, float *output, int C,
   const int pW = (W + 2 * P);
   const int pH = (H + 2 * P);
 
-  float value;
+  Dtype value;
   for (int c = c0; c < C; c += THREADS_PER_BLOCK) {
     value = input[n * (C * H * W) + h * (W * C) + w * C + c];
     output[n * (C * pH * pW) + (h + P) * (pW * C) + (w + P) * C + c] = value;
   }
 }
 
-template <unsigned int THREADS_PER_BLOCK>
-__global__ void Correlation_forward(float *output, int Cout, int Hout, int Wout,
-                                    float *pInput1, int Cin, int Hin, int Win,
-                                    float *pInput2, int pad, int kernel_size,
-                                    int max_displacement, int stride1,
-                                    int stride2) {
+// The kernels accumulate in float for all input types.
+template <typename Dtype, unsigned int THREADS_PER_BLOCK>
+__global__ void Correlation_forward(Dtype *output, int Cout, int Hout, int Wout,
+                                    const Dtype *pInput1, int Cin, int Hin,
+                                    int Win, const Dtype *pInput2, int pad,
+                                    int kernel_size, int max_displacement,
+                                    int stride1, int stride2, bool is_NCHW) {
   const int pWin = Win + 2 * pad;
   const int pHin = Hin + 2 * pad;
 
@@ -113,7 +116,8 @@ __global__ void Correlation_forward(float *output, int Cout, int Hout, int Wout,
                               (h1 + j) * (pWin * Cin) + (w1 + i) * Cin + ch;
             const int indx2 = n * (pHin * pWin * Cin) +
                               (h2 + j) * (pWin * Cin) + (w2 + i) * Cin + ch;
-            thread_accumulation += pInput1[indx1] * pInput2[indx2];
+            thread_accumulation += static_cast<float>(pInput1[indx1]) *
+                                   static_cast<float>(pInput2[indx2]);
           }
         }
       }
@@ -125,18 +129,125 @@ __global__ void Correlation_forward(float *output, int Cout, int Hout, int Wout,
       if (c == 0) {
         const int tc = (tj + displacement_rad) * displacement_size +
                        (ti + displacement_rad);
-        const int tindx = n * (Cout * Hout * Wout) + tc * (Hout * Wout) +
-                          blockIdx.y * Wout + blockIdx.z;
-        output[tindx] = reduce_sum / K;
+        const int tindx =
+            is_NCHW ? n * (Cout * Hout * Wout) + tc * (Hout * Wout) +
+                          blockIdx.y * Wout + blockIdx.z
+                    : n * (Cout * Hout * Wout) +
+                          (blockIdx.y * Wout + blockIdx.z) * Cout + tc;
+        output[tindx] = static_cast<Dtype>(reduce_sum / K);
       }
     }
   }
 }
 
-template <unsigned int THREADS_PER_BLOCK>
+// Same computation as Correlation_forward, but a block of threads cooperates
+// on one output position: the kernel patch of pInput1 and the window of
+// pInput2 covered by all displacements are staged in shared memory, in tiles
+// of `channel_tile` channels, and each thread computes the cost of its own
+// displacement from the shared tiles. Displacement grids larger than the
+// block are processed in blockDim.x x blockDim.y groups, which stage the
+// tiles again. The channels of a pixel are padded to an odd stride, so that
+// threads of neighbouring displacements read from different banks.
+template <typename Dtype>
+__global__ void Correlation_forward_tiled(
+    Dtype *output, int Cout, int Hout, int Wout, const Dtype *pInput1, int Cin,
+    int Hin, int Win, const Dtype *pInput2, int pad, int kernel_size,
+    int max_displacement, int stride1, int stride2, int channel_tile,
+    bool is_NCHW) {
+  extern __shared__ float shared_tiles[];
+
+  const int pWin = Win + 2 * pad;
+  const int pHin = Hin + 2 * pad;
+
+  const int kernel_rad = (kernel_size - 1) / 2;
+  const int displacement_rad = max_displacement / stride2;
+  const int displacement_size = 2 * displacement_rad + 1;
+  const int window_rad = kernel_rad + displacement_rad * stride2;
+  const int window_size = 2 * window_rad + 1;
+
+  const int n = blockIdx.x;
+  const int h1 = blockIdx.y * stride1 + max_displacement + kernel_rad;
+  const int w1 = blockIdx.z * stride1 + max_displacement + kernel_rad;
+
+  const int tid = threadIdx.y * blockDim.x + threadIdx.x;
+  const int num_threads = blockDim.x * blockDim.y;
+
+  // [kernel_size, kernel_size, pixel_stride] patch of pInput1 followed by
+  // the [window_size, window_size, pixel_stride] window of pInput2
+  const int pixel_stride = channel_tile | 1;
+  float *tile1 = shared_tiles;
+  float *tile2 = shared_tiles + kernel_size * kernel_size * pixel_stride;
+
+  const int K = kernel_size * kernel_size * Cin;
+  const int offset = n * (pHin * pWin * Cin);
+
+  for (int tj0 = 0; tj0 < displacement_size; tj0 += blockDim.y) {
+    for (int ti0 = 0; ti0 < displacement_size; ti0 += blockDim.x) {
+      const int ti = ti0 + threadIdx.x;
+      const int tj = tj0 + threadIdx.y;
+      // all threads stage the tiles, even without a displacement
+      const bool active = ti < displacement_size && tj < displacement_size;
+
+      float thread_accumulation = 0;
+
+      for (int c0 = 0; c0 < Cin; c0 += channel_tile) {
+        const int tile_channels = min(channel_tile, Cin - c0);
+
+        for (int idx = tid; idx < kernel_size * kernel_size * tile_channels;
+             idx += num_threads) {
+          const int ch = idx % tile_channels;
+          const int i = (idx / tile_channels) % kernel_size;
+          const int j = idx / tile_channels / kernel_size;
+          tile1[(j * kernel_size + i) * pixel_stride + ch] = static_cast<float>(
+              pInput1[offset + (h1 - kernel_rad + j) * (pWin * Cin) +
+                      (w1 - kernel_rad + i) * Cin + c0 + ch]);
+        }
+        for (int idx = tid; idx < window_size * window_size * tile_channels;
+             idx += num_threads) {
+          const int ch = idx % tile_channels;
+          const int i = (idx / tile_channels) % window_size;
+          const int j = idx / tile_channels / window_size;
+          tile2[(j * window_size + i) * pixel_stride + ch] = static_cast<float>(
+              pInput2[offset + (h1 - window_rad + j) * (pWin * Cin) +
+                      (w1 - window_rad + i) * Cin + c0 + ch]);
+        }
+        __syncthreads();
+
+        if (active) {
+          for (int j = 0; j < kernel_size; ++j) {
+            for (int i = 0; i < kernel_size; ++i) {
+              const float *patch1 =
+                  tile1 + (j * kernel_size + i) * pixel_stride;
+              const float *patch2 = tile2 + ((tj * stride2 + j) * window_size +
+                                             ti * stride2 + i) *
+                                                pixel_stride;
+              for (int ch = 0; ch < tile_channels; ++ch) {
+                thread_accumulation += patch1[ch] * patch2[ch];
+              }
+            }
+          }
+        }
+        __syncthreads();
+      }
+
+      if (active) {
+        // for NHWC, neighbouring threads write neighbouring output channels
+        const int tc = tj * displacement_size + ti;
+        const int tindx =
+            is_NCHW ? n * (Cout * Hout * Wout) + tc * (Hout * Wout) +
+                          blockIdx.y * Wout + blockIdx.z
+                    : n * (Cout * Hout * Wout) +
+                          (blockIdx.y * Wout + blockIdx.z) * Cout + tc;
+        output[tindx] = static_cast<Dtype>(thread_accumulation / K);
+      }
+    }
+  }
+}
+
+template <typename Dtype, unsigned int THREADS_PER_BLOCK>
 __global__ void Correlation_backward_input1(
-    int item, float *gradInput1, int Cin, int Hin, int Win,
-    const float *gradOutput, int Cout, int Hout, int Wout, const float *rInput2,
+    int item, Dtype *gradInput1, int Cin, int Hin, int Win,
+    const Dtype *gradOutput, int Cout, int Hout, int Wout, const Dtype *rInput2,
     int pad_size, int kernel_size, int max_displacement, int stride1,
     int stride2, bool is_NCHW) {
   const int n = item;
@@ -186,13 +297,15 @@ __global__ void Correlation_backward_input1(
     int indx2 =
         n * (pHin * pWin * Cin) + (h + j2) * (pWin * Cin) + (w + i2) * Cin + c;
 
-    float val2 = rInput2[indx2];
+    float val2 = static_cast<float>(rInput2[indx2]);
 
     for (int j = Hmin; j <= Hmax; ++j) {
       for (int i = Wmin; i <= Wmax; ++i) {
         const int tindx =
-            n * (Cout * Hout * Wout) + tc * (Hout * Wout) + j * Wout + i;
-        thread_accumulation += gradOutput[tindx] * val2;
+            is_NCHW
+                ? n * (Cout * Hout * Wout) + tc * (Hout * Wout) + j * Wout + i
+                : n * (Cout * Hout * Wout) + (j * Wout + i) * Cout + tc;
+        thread_accumulation += static_cast<float>(gradOutput[tindx]) * val2;
       }
     }
   }
@@ -205,19 +318,19 @@ __global__ void Correlation_backward_input1(
     if (is_NCHW) {
       const int indx1 = n * (Cin * Hin * Win) + c * (Hin * Win) +
                         (h - pad_size) * Win + (w - pad_size);
-      gradInput1[indx1] = reduce_sum / nelems;
+      gradInput1[indx1] = static_cast<Dtype>(reduce_sum / nelems);
     } else {
       const int indx1 = n * (Cin * Hin * Win) + (h - pad_size) * (Win * Cin) +
                         (w - pad_size) * Cin + c;
-      gradInput1[indx1] = reduce_sum / nelems;
+      gradInput1[indx1] = static_cast<Dtype>(reduce_sum / nelems);
     }
   }
 }
 
-template <unsigned int THREADS_PER_BLOCK>
+template <typename Dtype, unsigned int THREADS_PER_BLOCK>
 __global__ void Correlation_backward_input2(
-    int item, float *gradInput2, int Cin, int Hin, int Win,
-    const float *gradOutput, int Cout, int Hout, int Wout, const float *rInput1,
+    int item, Dtype *gradInput2, int Cin, int Hin, int Win,
+    const Dtype *gradOutput, int Cout, int Hout, int Wout, const Dtype *rInput1,
     int pad_size, int kernel_size, int max_displacement, int stride1,
     int stride2, bool is_NCHW) {
   const int n = item;
@@ -266,13 +379,15 @@ __global__ void Correlation_backward_input2(
 
     const int indx1 =
         n * (pHin * pWin * Cin) + (h - j2) * (pWin * Cin) + (w - i2) * Cin + c;
-    const float val1 = rInput1[indx1];
+    const float val1 = static_cast<float>(rInput1[indx1]);
 
     for (int j = Hmin; j <= Hmax; ++j) {
       for (int i = Wmin; i <= Wmax; ++i) {
         const int tindx =
-            n * (Cout * Hout * Wout) + tc * (Hout * Wout) + j * Wout + i;
-        thread_accumulation += gradOutput[tindx] * val1;
+            is_NCHW
+                ? n * (Cout * Hout * Wout) + tc * (Hout * Wout) + j * Wout + i
+                : n * (Cout * Hout * Wout) + (j * Wout + i) * Cout + tc;
+        thread_accumulation += static_cast<float>(gradOutput[tindx]) * val1;
       }
     }
   }
@@ -284,15 +399,195 @@ __global__ void Correlation_backward_input2(
     if (is_NCHW) {
       const int indx2 = n * (Cin * Hin * Win) + c * (Hin * Win) +
                         (h - pad_size) * (Win) + (w - pad_size);
-      gradInput2[indx2] = reduce_sum / nelems;
+      gradInput2[indx2] = static_cast<Dtype>(reduce_sum / nelems);
     } else {
       const int indx2 = n * (Cin * Hin * Win) + (h - pad_size) * (Win * Cin) +
                         (w - pad_size) * Cin + c;
-      gradInput2[indx2] = reduce_sum / nelems;
+      gradInput2[indx2] = static_cast<Dtype>(reduce_sum / nelems);
     }
   }
 }
 
+// Zero-pads both inputs into the NHWC `padded_a_t` and `padded_b_t` the
+// correlation kernels operate on.
+template <typename Dtype>
+void PadInputs(const Tensor &input_a_t, const Tensor &input_b_t,
+               Tensor *padded_a_t, Tensor *padded_b_t, int pad,
+               TensorFormat data_format) {
+  // do not change: the CUDA kernels expects THREADS_PER_BLOCK==32
+  const int THREADS_PER_BLOCK = 32;
+
+  const int32 N = GetTensorDim(input_a_t, data_format, 'N');
+  const int32 iC = GetTensorDim(input_a_t, data_format, 'C');
+  const int32 iH = GetTensorDim(input_a_t, data_format, 'H');
+  const int32 iW = GetTensorDim(input_a_t, data_format, 'W');
+
+  dim3 blocks_grid(N, iH, iW);
+  dim3 threads_block(THREADS_PER_BLOCK);
+
+  // set everything to zero (we zero-pad)
+  cudaMemset(padded_a_t->flat<Dtype>().data(), 0,
+             padded_a_t->NumElements() * sizeof(Dtype));
+  cudaMemset(padded_b_t->flat<Dtype>().data(), 0,
+             padded_b_t->NumElements() * sizeof(Dtype));
+
+  const bool is_NCHW = (data_format == FORMAT_NCHW);
+  if (is_NCHW) {
+    pad_and_transpose<Dtype, THREADS_PER_BLOCK><<<blocks_grid, threads_block>>>(
+        input_a_t.flat<Dtype>().data(), padded_a_t->flat<Dtype>().data(), iC,
+        iH, iW, pad);
+    pad_and_transpose<Dtype, THREADS_PER_BLOCK><<<blocks_grid, threads_block>>>(
+        input_b_t.flat<Dtype>().data(), padded_b_t->flat<Dtype>().data(), iC,
+        iH, iW, pad);
+  } else {
+    pad_and_no_transpose<Dtype, THREADS_PER_BLOCK>
+        <<<blocks_grid, threads_block>>>(input_a_t.flat<Dtype>().data(),
+                                         padded_a_t->flat<Dtype>().data(), iC,
+                                         iH, iW, pad);
+    pad_and_no_transpose<Dtype, THREADS_PER_BLOCK>
+        <<<blocks_grid, threads_block>>>(input_b_t.flat<Dtype>().data(),
+                                         padded_b_t->flat<Dtype>().data(), iC,
+                                         iH, iW, pad);
+  }
+}
+
+// Computes the cost volume from the padded inputs.
+template <typename Dtype>
+void CorrelationForward(OpKernelContext *context, const Tensor &padded_a_t,
+                        const Tensor &padded_b_t, Tensor *output_t,
+                        int kernel_size, int max_displacement, int stride_1,
+                        int stride_2, int pad, TensorFormat data_format) {
+  // do not change: the CUDA kernels expects THREADS_PER_BLOCK==32
+  const int THREADS_PER_BLOCK = 32;
+
+  // padded inputs are NHWC
+  const int32 N = padded_a_t.dim_size(0);
+  const int32 iH = padded_a_t.dim_size(1) - 2 * pad;
+  const int32 iW = padded_a_t.dim_size(2) - 2 * pad;
+  const int32 iC = padded_a_t.dim_size(3);
+
+  // the output has the same format as the inputs
+  const int32 oC = GetTensorDim(*output_t, data_format, 'C');
+  const int32 oH = GetTensorDim(*output_t, data_format, 'H');
+  const int32 oW = GetTensorDim(*output_t, data_format, 'W');
+
+  cudaMemset(output_t->flat<Dtype>().data(), 0,
+             output_t->NumElements() * sizeof(Dtype));
+
+  const bool is_NCHW = (data_format == FORMAT_NCHW);
+  const GPUDevice &d = context->eigen_gpu_device();
+
+  dim3 totalBlocksCorr(N, oH, oW);
+
+  // The tiled kernel only saves loads of pInput2 when the patches of
+  // neighbouring displacements overlap, i.e. for kernel_size > 1. Otherwise
+  // the warp-parallel channel reduction of Correlation_forward is faster.
+  // It uses one thread per displacement (for up to 32 x 32 displacements),
+  // as long as the shared tiles of at least one channel fit into the
+  // (default) 48 KB of shared memory per block. The tiles may take one more
+  // channel per pixel for the odd stride.
+  const int displacement_size = 2 * (max_displacement / stride_2) + 1;
+  const int window_size =
+      kernel_size + 2 * (max_displacement / stride_2) * stride_2;
+  const int tile_elements_per_channel =
+      kernel_size * kernel_size + window_size * window_size;
+  const int channel_tile = std::min(
+      std::min(iC, THREADS_PER_BLOCK),
+      static_cast<int>(48 * 1024 / sizeof(float)) / tile_elements_per_channel -
+          1);
+
+  if (kernel_size > 1 && channel_tile > 0) {
+    const int block_size = std::min(displacement_size, 32);
+    dim3 threadsPerBlock(block_size, block_size);
+    const size_t shared_memory_size =
+        tile_elements_per_channel * (channel_tile | 1) * sizeof(float);
+
+    Correlation_forward_tiled<Dtype>
+        <<<totalBlocksCorr, threadsPerBlock, shared_memory_size, d.stream()>>>(
+            output_t->flat<Dtype>().data(), oC, oH, oW,
+            padded_a_t.flat<Dtype>().data(), iC, iH, iW,
+            padded_b_t.flat<Dtype>().data(), pad, kernel_size, max_displacement,
+            stride_1, stride_2, channel_tile, is_NCHW);
+  } else {
+    dim3 threadsPerBlock(THREADS_PER_BLOCK);
+
+    Correlation_forward<Dtype, THREADS_PER_BLOCK>
+        <<<totalBlocksCorr, threadsPerBlock, 0, d.stream()>>>(
+            output_t->flat<Dtype>().data(), oC, oH, oW,
+            padded_a_t.flat<Dtype>().data(), iC, iH, iW,
+            padded_b_t.flat<Dtype>().data(), pad, kernel_size, max_displacement,
+            stride_1, stride_2, is_NCHW);
+  }
+}
+
+// Computes the gradients of both inputs from the padded inputs.
+template <typename Dtype>
+void CorrelationBackward(const Tensor &padded_a_t, const Tensor &padded_b_t,
+                         const Tensor &topdiff_t, Tensor *output_a_gradient_t,
+                         Tensor *output_b_gradient_t, int kernel_size,
+                         int max_displacement, int stride_1, int stride_2,
+                         int pad, TensorFormat data_format) {
+  // do not change: the CUDA kernels expects THREADS_PER_BLOCK==32
+  const int THREADS_PER_BLOCK = 32;
+
+  const int32 N = GetTensorDim(*output_a_gradient_t, data_format, 'N');
+  const int32 iC = GetTensorDim(*output_a_gradient_t, data_format, 'C');
+  const int32 iH = GetTensorDim(*output_a_gradient_t, data_format, 'H');
+  const int32 iW = GetTensorDim(*output_a_gradient_t, data_format, 'W');
+
+  const int32 oC = GetTensorDim(topdiff_t, data_format, 'C');
+  const int32 oH = GetTensorDim(topdiff_t, data_format, 'H');
+  const int32 oW = GetTensorDim(topdiff_t, data_format, 'W');
+
+  cudaMemset(output_a_gradient_t->flat<Dtype>().data(), 0,
+             output_a_gradient_t->NumElements() * sizeof(Dtype));
+  cudaMemset(output_b_gradient_t->flat<Dtype>().data(), 0,
+             output_b_gradient_t->NumElements() * sizeof(Dtype));
+
+  const bool is_NCHW = (data_format == FORMAT_NCHW);
+
+  dim3 threadsPerBlock(THREADS_PER_BLOCK);
+  dim3 totalBlocksCorr(iH, iW, iC);
+
+  for (int n = 0; n < N; ++n) {
+    Correlation_backward_input1<Dtype, THREADS_PER_BLOCK>
+        <<<totalBlocksCorr, threadsPerBlock>>>(
+            n, output_a_gradient_t->flat<Dtype>().data(), iC, iH, iW,
+            topdiff_t.flat<Dtype>().data(), oC, oH, oW,
+            padded_b_t.flat<Dtype>().data(), pad, kernel_size, max_displacement,
+            stride_1, stride_2, is_NCHW);
+  }
+
+  for (int n = 0; n < N; n++) {
+    Correlation_backward_input2<Dtype, THREADS_PER_BLOCK>
+        <<<totalBlocksCorr, threadsPerBlock>>>(
+            n, output_b_gradient_t->flat<Dtype>().data(), iC, iH, iW,
+            topdiff_t.flat<Dtype>().data(), oC, oH, oW,
+            padded_a_t.flat<Dtype>().data(), pad, kernel_size, max_displacement,
+            stride_1, stride_2, is_NCHW);
+  }
+}
+
+// Allocates the temporary padded inputs.
+template <typename Dtype>
+Status AllocatePaddedInputs(OpKernelContext *context, const Tensor &input_a_t,
+                            int pad, TensorFormat data_format,
+                            Tensor *padded_a_t, Tensor *padded_b_t) {
+  const int32 N = GetTensorDim(input_a_t, data_format, 'N');
+  const int32 iC = GetTensorDim(input_a_t, data_format, 'C');
+  const int32 iH = GetTensorDim(input_a_t, data_format, 'H');
+  const int32 iW = GetTensorDim(input_a_t, data_format, 'W');
+
+  TensorShape padded_shape({N, iH + 2 * pad, iW + 2 * pad, iC});
+  Status s = context->allocate_temp(DataTypeToEnum<Dtype>::value,
+                                    padded_shape, padded_a_t);
+  if (!TF_PREDICT_TRUE(s.ok())) {
+    return s;
+  }
+  return context->allocate_temp(DataTypeToEnum<Dtype>::value, padded_shape,
+                                padded_b_t);
+}
+
 };  // namespace
 
 template <typename Dtype>
@@ -302,74 +597,20 @@ struct CorrelationCostFunctor<GPUDevice, Dtype> {
                     /* params */
                     int kernel_size, int max_displacement, int stride_1,
                     int stride_2, int pad, TensorFormat data_format) {
-    // do not change: the CUDA kernels expects THREADS_PER_BLOCK==32
-    const int THREADS_PER_BLOCK = 32;
-
-    const int32 N = GetTensorDim(input_a_t, data_format, 'N');
-    const int32 iC = GetTensorDim(input_a_t, data_format, 'C');
-    const int32 iH = GetTensorDim(input_a_t, data_format, 'H');
-    const int32 iW = GetTensorDim(input_a_t, data_format, 'W');
-
     Tensor padded_a_t;
     Tensor padded_b_t;
-    TensorShape padded_shape({N, iH + 2 * pad, iW + 2 * pad, iC});
-    Status s;
-    s = context->allocate_temp(DataTypeToEnum<Dtype>::value, padded_shape,
-                               &padded_a_t);
-    if (!TF_PREDICT_TRUE(s.ok())) {
-      return s;
-    }
-    s = context->allocate_temp(DataTypeToEnum<Dtype>::value, padded_shape,
-                               &padded_b_t);
+    Status s = AllocatePaddedInputs<Dtype>(context, input_a_t, pad,
+                                           data_format, &padded_a_t,
+                                           &padded_b_t);
     if (!TF_PREDICT_TRUE(s.ok())) {
       return s;
     }
 
-    dim3 blocks_grid(N, iH, iW);
-    dim3 threads_block(THREADS_PER_BLOCK);
-
-    // the output is always NCHW (python transposes it to NHWC)
-    const int32 oC = GetTensorDim(*output_t, FORMAT_NCHW, 'C');
-    const int32 oH = GetTensorDim(*output_t, FORMAT_NCHW, 'H');
-    const int32 oW = GetTensorDim(*output_t, FORMAT_NCHW, 'W');
-
-    // set everything to zero (we zero-pad)
-    cudaMemset(padded_a_t.flat<Dtype>().data(), 0,
-               padded_a_t.NumElements() * sizeof(Dtype));
-    cudaMemset(padded_b_t.flat<Dtype>().data(), 0,
-               padded_b_t.NumElements() * sizeof(Dtype));
-    cudaMemset(output_t->flat<Dtype>().data(), 0,
-               output_t->NumElements() * sizeof(Dtype));
-
-    const bool is_NCHW = (data_format == FORMAT_NCHW);
-    if (is_NCHW) {
-      pad_and_transpose<THREADS_PER_BLOCK><<<blocks_grid, threads_block>>>(
-          input_a_t.flat<Dtype>().data(), padded_a_t.flat<Dtype>().data(), iC,
-          iH, iW, pad);
-      pad_and_transpose<THREADS_PER_BLOCK><<<blocks_grid, threads_block>>>(
-          input_b_t.flat<Dtype>().data(), padded_b_t.flat<Dtype>().data(), iC,
-          iH, iW, pad);
-    } else {
-      pad_and_no_transpose<THREADS_PER_BLOCK><<<blocks_grid, threads_block>>>(
-          input_a_t.flat<Dtype>().data(), padded_a_t.flat<Dtype>().data(), iC,
-          iH, iW, pad);
-      pad_and_no_transpose<THREADS_PER_BLOCK><<<blocks_grid, threads_block>>>(
-          input_b_t.flat<Dtype>().data(), padded_b_t.flat<Dtype>().data(), iC,
-          iH, iW, pad);
-    }
-
-    const GPUDevice &d = context->eigen_gpu_device();
-
-    dim3 threadsPerBlock(THREADS_PER_BLOCK);
-    dim3 totalBlocksCorr(N, oH, oW);
-
-    Correlation_forward<
-        THREADS_PER_BLOCK><<<totalBlocksCorr, threadsPerBlock, 0, d.stream()>>>(
-        output_t->flat<Dtype>().data(), oC, oH, oW,
-        padded_a_t.flat<Dtype>().data(), iC, iH, iW,
-        padded_b_t.flat<Dtype>().data(), pad, kernel_size, max_displacement,
-        stride_1, stride_2);
-
+    PadInputs<Dtype>(input_a_t, input_b_t, &padded_a_t, &padded_b_t, pad,
+                     data_format);
+    CorrelationForward<Dtype>(context, padded_a_t, padded_b_t, output_t,
+                              kernel_size, max_displacement, stride_1,
+                              stride_2, pad, data_format);
     return Status::OK();
   }
 };
@@ -382,93 +623,67 @@ struct CorrelationCostGradFunctor<GPUDevice, Dtype> {
                     /* params */
                     int kernel_size, int max_displacement, int stride_1,
                     int stride_2, int pad, TensorFormat data_format) {
-    // do not change: the CUDA kernels expects THREADS_PER_BLOCK==32
-    const int THREADS_PER_BLOCK = 32;
-
-    const int32 N = GetTensorDim(input_a_t, data_format, 'N');
-    const int32 iC = GetTensorDim(input_a_t, data_format, 'C');
-    const int32 iH = GetTensorDim(input_a_t, data_format, 'H');
-    const int32 iW = GetTensorDim(input_a_t, data_format, 'W');
-
     Tensor padded_a_t;
     Tensor padded_b_t;
-    TensorShape padded_shape({N, iH + 2 * pad, iW + 2 * pad, iC});
-    Status s;
-    s = context->allocate_temp(DataTypeToEnum<Dtype>::value, padded_shape,
-                               &padded_a_t);
-    if (!TF_PREDICT_TRUE(s.ok())) {
-      return s;
-    }
-    s = context->allocate_temp(DataTypeToEnum<Dtype>::value, padded_shape,
-                               &padded_b_t);
+    Status s = AllocatePaddedInputs<Dtype>(context, input_a_t, pad,
+                                           data_format, &padded_a_t,
+                                           &padded_b_t);
     if (!TF_PREDICT_TRUE(s.ok())) {
       return s;
     }
 
-    dim3 blocks_grid(N, iH, iW);
-    dim3 threads_block(THREADS_PER_BLOCK);
-
-    // topdiff is NCHW
-    const int32 oC = GetTensorDim(topdiff_t, FORMAT_NCHW, 'C');
-    const int32 oH = GetTensorDim(topdiff_t, FORMAT_NCHW, 'H');
-    const int32 oW = GetTensorDim(topdiff_t, FORMAT_NCHW, 'W');
-
-    // set everything to zero (we zero-pad)
-    cudaMemset(padded_a_t.flat<Dtype>().data(), 0,
-               padded_a_t.NumElements() * sizeof(Dtype));
-    cudaMemset(padded_b_t.flat<Dtype>().data(), 0,
-               padded_b_t.NumElements() * sizeof(Dtype));
-    cudaMemset(output_a_gradient_t->flat<Dtype>().data(), 0,
-               output_a_gradient_t->NumElements() * sizeof(Dtype));
-    cudaMemset(output_b_gradient_t->flat<Dtype>().data(), 0,
-               output_b_gradient_t->NumElements() * sizeof(Dtype));
-
-    const bool is_NCHW = (data_format == FORMAT_NCHW);
-    if (is_NCHW) {
-      pad_and_transpose<THREADS_PER_BLOCK><<<blocks_grid, threads_block>>>(
-          input_a_t.flat<Dtype>().data(), padded_a_t.flat<Dtype>().data(), iC,
-          iH, iW, pad);
-      pad_and_transpose<THREADS_PER_BLOCK><<<blocks_grid, threads_block>>>(
-          input_b_t.flat<Dtype>().data(), padded_b_t.flat<Dtype>().data(), iC,
-          iH, iW, pad);
-    } else {
-      pad_and_no_transpose<THREADS_PER_BLOCK><<<blocks_grid, threads_block>>>(
-          input_a_t.flat<Dtype>().data(), padded_a_t.flat<Dtype>().data(), iC,
-          iH, iW, pad);
-      pad_and_no_transpose<THREADS_PER_BLOCK><<<blocks_grid, threads_block>>>(
-          input_b_t.flat<Dtype>().data(), padded_b_t.flat<Dtype>().data(), iC,
-          iH, iW, pad);
-    }
-
-    const GPUDevice &d = context->eigen_gpu_device();
-
-    dim3 threadsPerBlock(THREADS_PER_BLOCK);
-    dim3 totalBlocksCorr(iH, iW, iC);
-
-    for (int n = 0; n < N; ++n) {
-      Correlation_backward_input1<
-          THREADS_PER_BLOCK><<<totalBlocksCorr, threadsPerBlock>>>(
-          n, output_a_gradient_t->flat<Dtype>().data(), iC, iH, iW,
-          topdiff_t.flat<Dtype>().data(), oC, oH, oW,
-          padded_b_t.flat<Dtype>().data(), pad, kernel_size, max_displacement,
-          stride_1, stride_2, is_NCHW);
-    }
+    PadInputs<Dtype>(input_a_t, input_b_t, &padded_a_t, &padded_b_t, pad,
+                     data_format);
+    CorrelationBackward<Dtype>(padded_a_t, padded_b_t, topdiff_t,
+                               output_a_gradient_t, output_b_gradient_t,
+                               kernel_size, max_displacement, stride_1,
+                               stride_2, pad, data_format);
+    return Status::OK();
+  }
+};
 
-    for (int n = 0; n < N; n++) {
-      Correlation_backward_input2<
-          THREADS_PER_BLOCK><<<totalBlocksCorr, threadsPerBlock>>>(
-          n, output_b_gradient_t->flat<Dtype>().data(), iC, iH, iW,
-          topdiff_t.flat<Dtype>().data(), oC, oH, oW,
-          padded_a_t.flat<Dtype>().data(), pad, kernel_size, max_displacement,
-          stride_1, stride_2, is_NCHW);
-    }
+template <typename Dtype>
+struct CorrelationCostFusedFunctor<GPUDevice, Dtype> {
+  Status operator()(OpKernelContext *context, const Tensor &input_a_t,
+                    const Tensor &input_b_t, Tensor *output_t,
+                    Tensor *padded_a_t, Tensor *padded_b_t,
+                    /* params */
+                    int kernel_size, int max_displacement, int stride_1,
+                    int stride_2, int pad, TensorFormat data_format) {
+    PadInputs<Dtype>(input_a_t, input_b_t, padded_a_t, padded_b_t, pad,
+                     data_format);
+    CorrelationForward<Dtype>(context, *padded_a_t, *padded_b_t, output_t,
+                              kernel_size, max_displacement, stride_1,
+                              stride_2, pad, data_format);
+    return Status::OK();
+  }
+};
 
+template <typename Dtype>
+struct CorrelationCostFusedGradFunctor<GPUDevice, Dtype> {
+  Status operator()(OpKernelContext *context, const Tensor &padded_a_t,
+                    const Tensor &padded_b_t, const Tensor &topdiff_t,
+                    Tensor *output_a_gradient_t, Tensor *output_b_gradient_t,
+                    /* params */
+                    int kernel_size, int max_displacement, int stride_1,
+                    int stride_2, int pad, TensorFormat data_format) {
+    CorrelationBackward<Dtype>(padded_a_t, padded_b_t, topdiff_t,
+                               output_a_gradient_t, output_b_gradient_t,
+                               kernel_size, max_displacement, stride_1,
+                               stride_2, pad, data_format);
     return Status::OK();
   }
 };
 
-template struct CorrelationCostFunctor<GPUDevice, float>;
-template struct CorrelationCostGradFunctor<GPUDevice, float>;
+#define DEFINE_GPU_SPECS(T)                                  \
+  template struct CorrelationCostFunctor<GPUDevice, T>;      \
+  template struct CorrelationCostGradFunctor<GPUDevice, T>;  \
+  template struct CorrelationCostFusedFunctor<GPUDevice, T>; \
+  template struct CorrelationCostFusedGradFunctor<GPUDevice, T>;
+
+TF_CALL_float(DEFINE_GPU_SPECS);
+TF_CALL_half(DEFINE_GPU_SPECS);
+#undef DEFINE_GPU_SPECS
 
 }  // namespace functor
 }  // namespace addons
@@ -19,9 +19,93 @@
 namespace tensorflow {
 namespace addons {
 
+using ::tensorflow::shape_inference::DimensionHandle;
 using ::tensorflow::shape_inference::InferenceContext;
 using ::tensorflow::shape_inference::ShapeHandle;
 
+namespace {
+
+// Output spatial size ceil((size + 2 * pad - 2 * border) / stride_1), which
+// stays unknown for an unknown input size.
+Status CorrelationCostOutputSize(InferenceContext* c, DimensionHandle size,
+                                 int32 pad, int32 border, int32 stride_1,
+                                 DimensionHandle* out) {
+  DimensionHandle padded;
+  TF_RETURN_IF_ERROR(c->Add(size, 2 * pad, &padded));
+  // fails for inputs smaller than the border
+  TF_RETURN_IF_ERROR(c->Subtract(padded, 2 * border, &padded));
+  TF_RETURN_IF_ERROR(c->Add(padded, stride_1 - 1, &padded));
+  return c->Divide(padded, stride_1, /*evenly_divisible=*/false, out);
+}
+
+Status CorrelationCostShape(InferenceContext* c) {
+  ShapeHandle input_a, input_b, input;
+
+  TF_RETURN_IF_ERROR(c->WithRank(c->input(0), 4, &input_a));
+  TF_RETURN_IF_ERROR(c->WithRank(c->input(1), 4, &input_b));
+  TF_RETURN_IF_ERROR(c->Merge(input_a, input_b, &input));
+
+  string data_format;
+  Status s = c->GetAttr("data_format", &data_format);
+  const bool is_NCHW = s.ok() && data_format == "NCHW";
+
+  // get input shapes
+  DimensionHandle B = c->Dim(input, 0);
+  DimensionHandle H = c->Dim(input, is_NCHW ? 2 : 1);
+  DimensionHandle W = c->Dim(input, is_NCHW ? 3 : 2);
+
+  int32 kernel_size;
+  int32 max_displacement;
+  int32 stride_1;
+  int32 stride_2;
+  int32 pad;
+
+  TF_RETURN_IF_ERROR(c->GetAttr("kernel_size", &kernel_size));
+  TF_RETURN_IF_ERROR(c->GetAttr("max_displacement", &max_displacement));
+  // stride in input
+  TF_RETURN_IF_ERROR(c->GetAttr("stride_1", &stride_1));
+  // stride in patch
+  TF_RETURN_IF_ERROR(c->GetAttr("stride_2", &stride_2));
+  TF_RETURN_IF_ERROR(c->GetAttr("pad", &pad));
+
+  if (kernel_size < 1 || kernel_size % 2 == 0) {
+    return errors::InvalidArgument("kernel_size must be positive and odd, got ",
+                                   kernel_size);
+  }
+  if (stride_1 < 1 || stride_2 < 1) {
+    return errors::InvalidArgument("Strides must be positive, got ", stride_1,
+                                   " and ", stride_2);
+  }
+  if (max_displacement < 0 || pad < 0) {
+    return errors::InvalidArgument(
+        "max_displacement and pad must be non-negative, got ", max_displacement,
+        " and ", pad);
+  }
+
+  // output channels are d**2 where, d = 2r + 1
+  const int32 r = max_displacement / stride_2;
+  const int32 d = 2 * r + 1;
+  const int32 border = max_displacement + (kernel_size - 1) / 2;
+
+  DimensionHandle Cout = c->MakeDim(d * d);
+  // for spatial dimensions, we pad the inputs
+  DimensionHandle Hout, Wout;
+  TF_RETURN_IF_ERROR(
+      CorrelationCostOutputSize(c, H, pad, border, stride_1, &Hout));
+  TF_RETURN_IF_ERROR(
+      CorrelationCostOutputSize(c, W, pad, border, stride_1, &Wout));
+
+  // the output has the same format as the inputs
+  if (is_NCHW) {
+    c->set_output(0, c->MakeShape({B, Cout, Hout, Wout}));
+  } else {
+    c->set_output(0, c->MakeShape({B, Hout, Wout, Cout}));
+  }
+  return Status::OK();
+}
+
+}  // namespace
+
 // --------------------------------------------------------------------------
 
 REGISTER_OP("Addons>CorrelationCost")
@@ -35,58 +119,7 @@ REGISTER_OP("Addons>CorrelationCost")
     .Attr("pad: int")
     .Attr("data_format: {'NHWC', 'NCHW'} = 'NHWC'")
     .Attr("T: realnumbertype")
-    .SetShapeFn([](InferenceContext* c) {
-      ShapeHandle input_a, input_b, input;
-
-      TF_RETURN_IF_ERROR(c->WithRank(c->input(0), 4, &input_a));
-      TF_RETURN_IF_ERROR(c->WithRank(c->input(1), 4, &input_b));
-      TF_RETURN_IF_ERROR(c->Merge(input_a, input_b, &input));
-
-      // get input shapes
-      int32 B, H, W;
-      B = c->Value(c->Dim(input, 0));
-      string data_format;
-      Status s = c->GetAttr("data_format", &data_format);
-      if (s.ok() && data_format == "NCHW") {
-        H = c->Value(c->Dim(input, 2));
-        W = c->Value(c->Dim(input, 3));
-      } else {
-        H = c->Value(c->Dim(input, 1));
-        W = c->Value(c->Dim(input, 2));
-      }
-
-      int32 kernel_size;
-      int32 max_displacement;
-      int32 stride_1;
-      int32 stride_2;
-      int32 pad;
-
-      TF_RETURN_IF_ERROR(c->GetAttr("kernel_size", &kernel_size));
-      TF_RETURN_IF_ERROR(c->GetAttr("max_displacement", &max_displacement));
-      // stride in input
-      TF_RETURN_IF_ERROR(c->GetAttr("stride_1", &stride_1));
-      // stride in patch
-      TF_RETURN_IF_ERROR(c->GetAttr("stride_2", &stride_2));
-      TF_RETURN_IF_ERROR(c->GetAttr("pad", &pad));
-
-      // output channels are d**2 where, d = 2r + 1
-      const int32 r = max_displacement / stride_2;
-      const int32 d = 2 * r + 1;
-      const int32 border = max_displacement + (kernel_size - 1) / 2;
-
-      const int32 Cout = d * d;
-      // for spatial dimensions, we pad the inputs
-      const int32 Hout = static_cast<int>(
-          ceil(static_cast<float>(((H + 2 * pad) - border * 2)) /
-               static_cast<float>(stride_1)));
-      const int32 Wout = static_cast<int>(
-          ceil(static_cast<float>(((W + 2 * pad) - border * 2)) /
-               static_cast<float>(stride_1)));
-
-      // Note, the output is always NCHW (even when input is NHWC)
-      c->set_output(0, c->MakeShape({B, Cout, Hout, Wout}));
-      return Status::OK();
-    })
+    .SetShapeFn(CorrelationCostShape)
     .Doc(R"Doc(
 Compute Correlation costs.
 
@@ -131,5 +164,116 @@ REGISTER_OP("Addons>CorrelationCostGrad")
     })
     .Doc(R"doc(CorrelationCostGrad op.)doc");
 
+REGISTER_OP("Addons>CorrelationCostFused")
+    .Input("input_a: T")
+    .Input("input_b: T")
+    .Output("output: T")
+    .Output("padded_a: T")
+    .Output("padded_b: T")
+    .Attr("kernel_size: int")
+    .Attr("max_displacement: int")
+    .Attr("stride_1: int")
+    .Attr("stride_2: int")
+    .Attr("pad: int")
+    .Attr("data_format: {'NHWC', 'NCHW'} = 'NHWC'")
+    .Attr("T: realnumbertype")
+    .SetShapeFn([](InferenceContext* c) {
+      TF_RETURN_IF_ERROR(CorrelationCostShape(c));
+
+      ShapeHandle input;
+      TF_RETURN_IF_ERROR(c->Merge(c->input(0), c->input(1), &input));
+
+      string data_format;
+      TF_RETURN_IF_ERROR(c->GetAttr("data_format", &data_format));
+      int32 pad;
+      TF_RETURN_IF_ERROR(c->GetAttr("pad", &pad));
+
+      const bool is_NCHW = (data_format == "NCHW");
+      DimensionHandle H, W;
+      TF_RETURN_IF_ERROR(c->Add(c->Dim(input, is_NCHW ? 2 : 1), 2 * pad, &H));
+      TF_RETURN_IF_ERROR(c->Add(c->Dim(input, is_NCHW ? 3 : 2), 2 * pad, &W));
+
+      // the padded inputs are always NHWC
+      ShapeHandle padded = c->MakeShape(
+          {c->Dim(input, 0), H, W, c->Dim(input, is_NCHW ? 1 : 3)});
+      c->set_output(1, padded);
+      c->set_output(2, padded);
+      return Status::OK();
+    })
+    .Doc(R"Doc(
+Compute Correlation costs and keep the padded inputs for the gradient.
+
+Same as `CorrelationCost`, but additionally returns the zero-padded inputs
+in NHWC format, which `CorrelationCostFusedGrad` consumes instead of padding
+the inputs again.
+)Doc");
+
+REGISTER_OP("Addons>CorrelationCostFusedGrad")
+    .Input("padded_a: T")
+    .Input("padded_b: T")
+    .Input("top_diff: T")
+    .Output("bottom_diff_a: T")
+    .Output("bottom_diff_b: T")
+    .Attr("T: realnumbertype")
+    .Attr("kernel_size: int")
+    .Attr("max_displacement: int")
+    .Attr("stride_1: int")
+    .Attr("stride_2: int")
+    .Attr("pad: int")
+    .Attr("data_format: {'NHWC', 'NCHW'} = 'NHWC'")
+    .SetShapeFn([](InferenceContext* c) {
+      ShapeHandle padded;
+      TF_RETURN_IF_ERROR(c->WithRank(c->input(0), 4, &padded));
+      TF_RETURN_IF_ERROR(c->Merge(padded, c->input(1), &padded));
+
+      string data_format;
+      TF_RETURN_IF_ERROR(c->GetAttr("data_format", &data_format));
+      int32 pad;
+      TF_RETURN_IF_ERROR(c->GetAttr("pad", &pad));
+
+      DimensionHandle H, W;
+      TF_RETURN_IF_ERROR(c->Subtract(c->Dim(padded, 1), 2 * pad, &H));
+      TF_RETURN_IF_ERROR(c->Subtract(c->Dim(padded, 2), 2 * pad, &W));
+
+      ShapeHandle shp_hnd;
+      if (data_format == "NCHW") {
+        shp_hnd = c->MakeShape({c->Dim(padded, 0), c->Dim(padded, 3), H, W});
+      } else {
+        shp_hnd = c->MakeShape({c->Dim(padded, 0), H, W, c->Dim(padded, 3)});
+      }
+      c->set_output(0, shp_hnd);
+      c->set_output(1, shp_hnd);
+      return Status::OK();
+    })
+    .Doc(R"doc(CorrelationCostFusedGrad op.)doc");
+
+REGISTER_OP("Addons>CorrelationCostQuantized")
+    .Input("input_a: int8")
+    .Input("input_b: int8")
+    .Input("scale_a: float")
+    .Input("scale_b: float")
+    .Output("output: float")
+    .Attr("kernel_size: int")
+    .Attr("max_displacement: int")
+    .Attr("stride_1: int")
+    .Attr("stride_2: int")
+    .Attr("pad: int")
+    .Attr("data_format: {'NHWC', 'NCHW'} = 'NHWC'")
+    .SetShapeFn([](InferenceContext* c) {
+      ShapeHandle unused;
+      TF_RETURN_IF_ERROR(c->WithRank(c->input(2), 0, &unused));
+      TF_RETURN_IF_ERROR(c->WithRank(c->input(3), 0, &unused));
+      return CorrelationCostShape(c);
+    })
+    .Doc(R"Doc(
+Compute Correlation costs of quantized inputs.
+
+Same as `CorrelationCost` for the int8 inputs `input_a * scale_a` and
+`input_b * scale_b`. The inputs are expected in [-127, 127].
+
+scale_a: A scalar with the quantization step of `input_a`.
+scale_b: A scalar with the quantization step of `input_b`.
+)Doc");
+
 }  // namespace addons
 }  // namespace tensorflow
\ No newline at end of file
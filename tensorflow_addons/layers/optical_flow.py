@@ -25,8 +25,9 @@ from tensorflow_addons.utils.resource_loader import get_path_to_datafile
 _correlation_cost_op_so = tf.load_op_library(
     get_path_to_datafile("custom_ops/layers/_correlation_cost_ops.so"))
 
+tf.no_gradient("Addons>CorrelationCostQuantized")
+
 
-@tf.function
 def _correlation_cost(input_a,
                       input_b,
                       kernel_size,
@@ -35,6 +36,10 @@ def _correlation_cost(input_a,
                       stride_2,
                       pad,
                       data_format='channels_last',
+                      use_matmul=False,
+                      factorized=False,
+                      quantized=False,
+                      training=False,
                       name=None):
     """Correlation Cost Volume computation.
 
@@ -50,7 +55,8 @@ def _correlation_cost(input_a,
 
     where the patches of size K=2d + 1 are centered in position a resp. b.
 
-    The output shape is [B, C', H', W'], where
+    The output shape is [B, C', H', W'] (resp. [B, H', W', C'] for
+    "channels_last"), where
 
       r = max_displacement / stride_2;
       bd = max_displacement + (kernel_size - 1) / 2
@@ -58,8 +64,12 @@ def _correlation_cost(input_a,
       H' = H + 2 * (pad - bd) / stride_1
       W' = W + 2 * (pad - bd) / stride_1
 
-    Note: When the data_format requests "channels_last", an additional explicit
-      transpose operation is executed.
+    The inputs can be float32, float16 or (on CPU) bfloat16, the costs are
+    accumulated in float32 in all cases.
+
+    If `factorized` is set, only the horizontal and the vertical
+    displacements are computed and C' = 2 * (2 * r + 1): the first
+    2 * r + 1 channels hold the horizontal, the others the vertical costs.
 
     Args:
       input_a: A `Tensor` of the format specified by `data_format`.
@@ -76,6 +86,16 @@ def _correlation_cost(input_a,
           "channels_last" float [batch, height, width, channels]
           "channels_first" float [batch, channels, height, width]
           Defaults to `"channels_last"`.
+      use_matmul: A boolean. If `True`, the inner products over all
+          displacements are computed with one matmul per image row and
+          vertical displacement instead of the custom op.
+      factorized: A boolean. If `True`, the 2-D search window is replaced
+          by two orthogonal 1-D strips.
+      quantized: A boolean. If `True`, both inputs are quantized to int8
+          with one scale per tensor before computing the correlations.
+          The result has no gradient.
+      training: A boolean. If `True`, the padded inputs are kept for the
+          gradient instead of being rebuilt in the backward pass.
       name: A name for the operation (optional).
 
     Returns:
@@ -93,7 +113,52 @@ def _correlation_cost(input_a,
             raise ValueError("`data_format` must be either `channels_last` or"
                              "`channels_first`")
 
-        ret = op_call(
+        if quantized:
+            if use_matmul or factorized:
+                raise ValueError("`quantized` can not be combined with "
+                                 "`use_matmul` or `factorized`")
+
+            input_a = tf.convert_to_tensor(input_a)
+            quantized_a, scale_a = _quantize(input_a)
+            quantized_b, scale_b = _quantize(input_b)
+            ret = _correlation_cost_op_so.addons_correlation_cost_quantized(
+                quantized_a,
+                quantized_b,
+                scale_a,
+                scale_b,
+                kernel_size=kernel_size,
+                max_displacement=max_displacement,
+                stride_1=stride_1,
+                stride_2=stride_2,
+                pad=pad,
+                data_format=op_data_format)
+            return tf.cast(ret, input_a.dtype)
+
+        if use_matmul or factorized:
+            return _correlation_cost_matmul(
+                input_a,
+                input_b,
+                kernel_size=kernel_size,
+                max_displacement=max_displacement,
+                stride_1=stride_1,
+                stride_2=stride_2,
+                pad=pad,
+                data_format=data_format,
+                factorized=factorized)
+
+        if training:
+            ret, _, _ = _correlation_cost_op_so.addons_correlation_cost_fused(
+                input_a,
+                input_b,
+                kernel_size=kernel_size,
+                max_displacement=max_displacement,
+                stride_1=stride_1,
+                stride_2=stride_2,
+                pad=pad,
+                data_format=op_data_format)
+            return ret
+
+        return op_call(
             input_a,
             input_b,
             kernel_size=kernel_size,
@@ -102,11 +167,130 @@ def _correlation_cost(input_a,
             stride_2=stride_2,
             pad=pad,
             data_format=op_data_format)
-        if data_format == 'channels_last':
-            # this is easier to maintain without
-            # specializing an additional cuda kernel
-            return tf.transpose(ret, [0, 2, 3, 1])
-        return ret
+
+
+def _quantize(x):
+    """Symmetric int8 quantization of `x` with a single scale.
+
+    The values are limited to [-127, 127], which the quantized op expects.
+    """
+    x = tf.convert_to_tensor(x)
+    scale = tf.reduce_max(tf.abs(x)) / 127
+    scale = tf.where(scale > 0, scale, tf.ones_like(scale))
+    quantized = tf.cast(tf.round(x / scale), tf.int8)
+    return quantized, tf.cast(scale, tf.float32)
+
+
+def _band_products(input_a, input_b, count, rate):
+    """Inner products of `input_a` with horizontally displaced `input_b`.
+
+    `input_b` is `(count - 1) * rate` wider than `input_a`, the result
+    holds the products of `input_a[..., x, :]` with
+    `input_b[..., x + k * rate, :]` for the `count` displacements `k`.
+    """
+    shape = tf.shape(input_a)
+    width = shape[2]
+    width_b = tf.shape(input_b)[2]
+
+    # One GEMM per image row, [W, C] x [C, W_b] -> [W, W_b]
+    products = tf.linalg.matmul(input_a, input_b, transpose_b=True)
+
+    # Reading the rows with a stride of W_b + 1 turns the diagonals of the
+    # band into columns.
+    products = tf.reshape(products, tf.concat([shape[:2], [-1]], axis=0))
+    products = tf.pad(products, [[0, 0], [0, 0], [0, width]])
+    products = tf.reshape(products,
+                          tf.concat([shape[:2], [width, width_b + 1]], axis=0))
+    return products[..., :(count - 1) * rate + 1:rate]
+
+
+@tf.function(experimental_compile=True)
+def _correlation_cost_matmul(input_a,
+                             input_b,
+                             kernel_size,
+                             max_displacement,
+                             stride_1,
+                             stride_2,
+                             pad,
+                             data_format,
+                             factorized=False):
+    """Correlation Cost Volume computation with matmuls.
+
+    For each of the `2 * r + 1` vertical displacements, every image row of
+    `input_a` is multiplied with the displaced row of `input_b` in one
+    `tf.linalg.matmul`, and the `2 * r + 1` horizontal displacements are
+    the diagonals of the band around the center of the product. The patch
+    sum for `kernel_size > 1` is a separable average pooling of the
+    resulting cost volume.
+
+    With `factorized`, only the horizontal strip through the center is
+    computed this way, and the vertical strip is the same computation on
+    the columns.
+
+    Only standard ops are used, which XLA compiles into a few fused kernels.
+    """
+    if data_format == "channels_first":
+        input_a = tf.transpose(input_a, [0, 2, 3, 1])
+        input_b = tf.transpose(input_b, [0, 2, 3, 1])
+
+    r = max_displacement // stride_2
+    d = 2 * r + 1
+
+    paddings = [[0, 0], [pad, pad], [pad, pad], [0, 0]]
+    input_a = tf.pad(input_a, paddings)
+    input_b = tf.pad(input_b, paddings)
+
+    shape = tf.shape(input_a)
+    height, width, channels = shape[1], shape[2], shape[3]
+
+    # Displacements only reach r * stride_2, the rest of the border of
+    # input_b is never read.
+    border_a = max_displacement
+    border_b = max_displacement - r * stride_2
+    input_a = input_a[:, border_a:height - border_a, border_a:width - border_a]
+    input_b = input_b[:, border_b:height - border_b, border_b:width - border_b]
+
+    offset = r * stride_2
+    height_a = height - 2 * border_a
+    width_a = width - 2 * border_a
+    if factorized:
+        # Each strip only moves along one axis, the other one is cropped to
+        # the grid of input_a.
+        horizontal = _band_products(
+            input_a, input_b[:, offset:offset + height_a], d, stride_2)
+        vertical = _band_products(
+            tf.transpose(input_a, [0, 2, 1, 3]),
+            tf.transpose(input_b[:, :, offset:offset + width_a], [0, 2, 1, 3]),
+            d, stride_2)
+        ret = tf.concat(
+            [horizontal, tf.transpose(vertical, [0, 2, 1, 3])], axis=-1)
+    else:
+        # [N, H, W, d] per vertical displacement -> [N, H, W, d * d]
+        rows = []
+        for dy in range(d):
+            row_b = input_b[:, dy * stride_2:dy * stride_2 + height_a]
+            rows.append(_band_products(input_a, row_b, d, stride_2))
+        ret = tf.concat(rows, axis=-1)
+    ret = ret / tf.cast(channels, ret.dtype)
+
+    # The patch sum is separable, the rows and the columns are pooled in
+    # two passes that read each product kernel_size instead of
+    # kernel_size ** 2 times.
+    if kernel_size > 1 or stride_1 > 1:
+        ret = tf.nn.avg_pool2d(
+            ret,
+            ksize=[kernel_size, 1],
+            strides=[stride_1, 1],
+            padding="VALID")
+        ret = tf.nn.avg_pool2d(
+            ret,
+            ksize=[1, kernel_size],
+            strides=[1, stride_1],
+            padding="VALID")
+
+    if data_format == "channels_first":
+        return tf.transpose(ret, [0, 3, 1, 2])
+    return ret
 
 
 @tf.RegisterGradient("Addons>CorrelationCost")
@@ -118,15 +302,11 @@ def _correlation_cost_grad(op, grad_output):
     pad = op.get_attr("pad")
     data_format = op.get_attr("data_format")
 
-    input_a = tf.convert_to_tensor(op.inputs[0], name="input_a")
-    input_b = tf.convert_to_tensor(op.inputs[1], name="input_b")
-    grad_output_tensor = tf.convert_to_tensor(grad_output, name="grad_output")
-
     op_call = _correlation_cost_op_so.addons_correlation_cost_grad
     grads = op_call(
-        input_a,
-        input_b,
-        grad_output_tensor,
+        op.inputs[0],
+        op.inputs[1],
+        grad_output,
         kernel_size=kernel_size,
         max_displacement=max_displacement,
         stride_1=stride_1,
@@ -134,9 +314,24 @@ def _correlation_cost_grad(op, grad_output):
         pad=pad,
         data_format=data_format)
 
-    grad_input_a = tf.convert_to_tensor(grads[0], name="grad_input_a")
-    grad_input_b = tf.convert_to_tensor(grads[1], name="grad_input_b")
-    return [grad_input_a, grad_input_b]
+    return [grads[0], grads[1]]
+
+
+@tf.RegisterGradient("Addons>CorrelationCostFused")
+def _correlation_cost_fused_grad(op, grad_output, *unused_grads):
+    # The padded inputs of the forward pass replace the original inputs.
+    op_call = _correlation_cost_op_so.addons_correlation_cost_fused_grad
+    grads = op_call(
+        op.outputs[1],
+        op.outputs[2],
+        grad_output,
+        kernel_size=op.get_attr("kernel_size"),
+        max_displacement=op.get_attr("max_displacement"),
+        stride_1=op.get_attr("stride_1"),
+        stride_2=op.get_attr("stride_2"),
+        pad=op.get_attr("pad"),
+        data_format=op.get_attr("data_format"))
+    return [grads[0], grads[1]]
 
 
 @keras_utils.register_keras_custom_object
@@ -160,10 +355,30 @@ class CorrelationCost(tf.keras.layers.Layer):
                 "channels_last" float [batch, height, width, channels]
                 "channels_first" float [batch, channels, height, width]
                 Defaults to `"channels_last"`.
+        factorized: A boolean. If `True`, only the horizontal and vertical
+            displacements are computed, giving `2 * (2 * r + 1)` instead of
+            `(2 * r + 1) ** 2` output channels.
+        use_custom_op: A boolean. If `False`, the correlations are computed
+            with standard TensorFlow ops compiled by XLA instead of the
+            custom op, as one matmul per image row and vertical
+            displacement. For training, this keeps the products of those
+            matmuls for the gradient, which takes more memory than the
+            custom op.
+        dtype: Passing `'int8'` quantizes the inputs to int8 for the
+            correlations, the output stays floating point. Such a layer
+            can only be used for inference.
     """
 
-    def __init__(self, kernel_size, max_displacement, stride_1, stride_2, pad,
-                 data_format, **kwargs):
+    def __init__(self,
+                 kernel_size,
+                 max_displacement,
+                 stride_1,
+                 stride_2,
+                 pad,
+                 data_format,
+                 factorized=False,
+                 use_custom_op=True,
+                 **kwargs):
         self.kernel_size = kernel_size
         self.max_displacement = max_displacement
         self.stride_1 = stride_1
@@ -175,20 +390,65 @@ class CorrelationCost(tf.keras.layers.Layer):
                              "`channels_first`, instead got %s" % data_format)
 
         self.data_format = data_format
+        self.factorized = factorized
+
+        # The quantization only applies to the inputs of the op, the layer
+        # itself keeps computing in floating point.
+        self.quantized = kwargs.get('dtype') in ('int8', tf.int8)
+        if self.quantized:
+            del kwargs['dtype']
+
+        if self.quantized and not use_custom_op:
+            raise ValueError("`dtype=int8` requires `use_custom_op=True`")
+        if self.quantized and factorized:
+            raise ValueError("`dtype=int8` can not be combined with "
+                             "`factorized=True`")
+        self.use_custom_op = use_custom_op
 
         super(CorrelationCost, self).__init__(**kwargs)
 
+        # The configuration is fixed, so the output shapes only depend on
+        # the input shapes.
+        r = max_displacement // stride_2
+        if factorized:
+            self._output_c = 2 * (2 * r + 1)
+        else:
+            self._output_c = (2 * r + 1)**2
+        # The common FlowNet setup keeps the spatial size of the inputs.
+        self._is_identity_hw = (pad == max_displacement and kernel_size == 1
+                                and stride_1 == 1)
+        self._shape_cache = {}
+
     def build(self, input_shape):
         if not isinstance(input_shape, list):
             raise ValueError("Input must be a list of two Tensors to process")
         super(CorrelationCost, self).build(input_shape)
 
-    def call(self, inputs):
+    def call(self, inputs, training=None):
         if not isinstance(inputs, list):
             raise ValueError("Input must be a list of two Tensors to process")
 
-        input_a = tf.convert_to_tensor(inputs[0])
-        input_b = tf.convert_to_tensor(inputs[1])
+        input_a, input_b = inputs
+        if not tf.is_tensor(input_a):
+            input_a = tf.convert_to_tensor(input_a)
+        if not tf.is_tensor(input_b):
+            input_b = tf.convert_to_tensor(input_b)
+
+        if training is None:
+            training = tf.keras.backend.learning_phase()
+        training = bool(tf.get_static_value(training))
+
+        if not self.use_custom_op:
+            return _correlation_cost_matmul(
+                input_a,
+                input_b,
+                kernel_size=self.kernel_size,
+                max_displacement=self.max_displacement,
+                stride_1=self.stride_1,
+                stride_2=self.stride_2,
+                pad=self.pad,
+                data_format=self.data_format,
+                factorized=self.factorized)
 
         return _correlation_cost(
             input_a,
@@ -198,11 +458,22 @@ class CorrelationCost(tf.keras.layers.Layer):
             stride_1=self.stride_1,
             stride_2=self.stride_2,
             pad=self.pad,
-            data_format=self.data_format)
+            data_format=self.data_format,
+            factorized=self.factorized,
+            quantized=self.quantized,
+            training=training)
 
     def compute_output_shape(self, input_shape):
         assert isinstance(input_shape, list)
 
+        key = tuple(tuple(shape) for shape in input_shape)
+        if key not in self._shape_cache:
+            # Keras tracks lists, which can not be saved under tuple keys.
+            self._shape_cache[key] = tuple(
+                self._compute_output_shape(input_shape))
+        return list(self._shape_cache[key])
+
+    def _compute_output_shape(self, input_shape):
         #  Input validation
         if len(input_shape) != 2:
             raise ValueError("Input must be a list of two shapes")
@@ -212,23 +483,31 @@ class CorrelationCost(tf.keras.layers.Layer):
                 raise ValueError("Input shapes must match")
 
         n = input_shape[0][0]
-        r = self.max_displacement // self.stride_2
-        bd = self.max_displacement + (self.kernel_size - 1) // 2
-        output_c = (2 * r + 1)**2
+        output_c = self._output_c
 
         if self.data_format == "channels_first":
-            output_h = input_shape[0][2] + 2 * (self.pad - bd) // self.stride_1
-            output_w = input_shape[0][3] + 2 * (self.pad - bd) // self.stride_1
-            return [(n, output_c, output_h, output_w)]
-
+            output_h, output_w = input_shape[0][2], input_shape[0][3]
         elif self.data_format == "channels_last":
-            output_h = input_shape[0][1] + 2 * (self.pad - bd) // self.stride_1
-            output_w = input_shape[0][2] + 2 * (self.pad - bd) // self.stride_1
-            return [(n, output_h, output_w, output_c)]
+            output_h, output_w = input_shape[0][1], input_shape[0][2]
         else:
             raise ValueError("`data_format` must be either `channels_last` or"
                              "`channels_first`")
 
+        if not self._is_identity_hw:
+            # Same as the shape function of the op:
+            # ceil((size + 2 * pad - 2 * border) / stride_1)
+            bd = self.max_displacement + (self.kernel_size - 1) // 2
+            if output_h is not None:
+                output_h += 2 * (self.pad - bd)
+                output_h = (output_h + self.stride_1 - 1) // self.stride_1
+            if output_w is not None:
+                output_w += 2 * (self.pad - bd)
+                output_w = (output_w + self.stride_1 - 1) // self.stride_1
+
+        if self.data_format == "channels_first":
+            return [(n, output_c, output_h, output_w)]
+        return [(n, output_h, output_w, output_c)]
+
     def get_config(self):
         config = {
             'kernel_size': self.kernel_size,
@@ -236,8 +515,12 @@ class CorrelationCost(tf.keras.layers.Layer):
             'stride_1': self.stride_1,
             'stride_2': self.stride_2,
             'pad': self.pad,
-            'data_format': self.data_format
+            'data_format': self.data_format,
+            'factorized': self.factorized,
+            'use_custom_op': self.use_custom_op
         }
+        if self.quantized:
+            config['dtype'] = 'int8'
 
         base_config = super(CorrelationCost, self).get_config()
         return dict(list(base_config.items()) + list(config.items()))
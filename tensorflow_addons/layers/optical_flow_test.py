@@ -20,6 +20,8 @@ from __future__ import print_function
 import numpy as np
 import tensorflow as tf
 from tensorflow_addons.layers.optical_flow import CorrelationCost
+from tensorflow_addons.layers.optical_flow import _correlation_cost
+from tensorflow_addons.layers.optical_flow import _quantize
 from tensorflow_addons.utils import test_utils
 
 
@@ -103,7 +105,7 @@ class CorrelationCostTest(tf.test.TestCase):
                 tf.where(tf.equal(actual, 0))[:, 1], expected_ids)
             self.assertEqual(actual.shape, (2, 9, 7, 8))
 
-    def _gradients(self, data_format):
+    def _gradients(self, data_format, training=False):
         with test_utils.use_gpu():
             batch, channels, height, width = 2, 3, 5, 6
             input_a = np.random.randn(batch, channels, height,
@@ -131,13 +133,173 @@ class CorrelationCostTest(tf.test.TestCase):
                     stride_1=stride_1,
                     stride_2=stride_2,
                     pad=pad,
-                    data_format=data_format)([input_a, input_b])
+                    data_format=data_format)([input_a, input_b],
+                                             training=training)
 
             theoretical, numerical = tf.test.compute_gradient(
                 correlation_fn, [input_a_op, input_b_op])
 
             self.assertAllClose(theoretical[0], numerical[0], atol=1e-3)
 
+    def _half_precision(self, data_format):
+        with test_utils.use_gpu():
+            val_a = np.random.randn(2, 3, 5, 6).astype(np.float32)
+            val_b = np.random.randn(2, 3, 5, 6).astype(np.float32)
+            if data_format == 'channels_last':
+                val_a = np.transpose(val_a, [0, 2, 3, 1])
+                val_b = np.transpose(val_b, [0, 2, 3, 1])
+
+            def correlation_fn(input_a, input_b):
+                return _correlation_cost(
+                    input_a,
+                    input_b,
+                    kernel_size=3,
+                    max_displacement=2,
+                    stride_1=1,
+                    stride_2=2,
+                    pad=4,
+                    data_format=data_format)
+
+            for dtype in [tf.float16, tf.bfloat16]:
+                # Compare against float32 on the same rounded inputs.
+                input_a = tf.cast(val_a, dtype)
+                input_b = tf.cast(val_b, dtype)
+                inputs_32 = [
+                    tf.cast(input_a, tf.float32),
+                    tf.cast(input_b, tf.float32)
+                ]
+
+                with tf.GradientTape(persistent=True) as tape:
+                    tape.watch([input_a, input_b] + inputs_32)
+                    actual = correlation_fn(input_a, input_b)
+                    expected = correlation_fn(*inputs_32)
+                grads = tape.gradient(actual, [input_a, input_b])
+                grads_32 = tape.gradient(expected, inputs_32)
+
+                self.assertEqual(actual.dtype, dtype)
+                self.assertAllClose(
+                    tf.cast(actual, tf.float32), expected, atol=2e-2)
+                for grad, grad_32 in zip(grads, grads_32):
+                    self.assertEqual(grad.dtype, dtype)
+                    self.assertAllClose(
+                        tf.cast(grad, tf.float32), grad_32, atol=2e-2)
+
+    def _matmul(self, data_format):
+        with test_utils.use_gpu():
+            batch, channels, height, width = 2, 3, 7, 8
+            input_a = np.random.randn(batch, channels, height,
+                                      width).astype(np.float32)
+            input_b = np.random.randn(batch, channels, height,
+                                      width).astype(np.float32)
+
+            if data_format == 'channels_last':
+                input_a = np.transpose(input_a, [0, 2, 3, 1])
+                input_b = np.transpose(input_b, [0, 2, 3, 1])
+
+            for kernel_size, max_displacement, stride_1, stride_2, pad in [
+                (1, 2, 1, 2, 4), (1, 3, 1, 2, 3), (3, 2, 1, 1, 3),
+                (5, 2, 1, 1, 4), (1, 2, 2, 1, 2), (3, 2, 3, 2, 1)
+            ]:
+                params = dict(
+                    kernel_size=kernel_size,
+                    max_displacement=max_displacement,
+                    stride_1=stride_1,
+                    stride_2=stride_2,
+                    pad=pad,
+                    data_format=data_format)
+                expected = _correlation_cost(input_a, input_b, **params)
+                actual = _correlation_cost(
+                    input_a, input_b, use_matmul=True, **params)
+                self.assertAllClose(actual, expected)
+
+    def _pure_tf(self, data_format):
+        with test_utils.use_gpu():
+            val_a, val_b = self._create_test_data(data_format)
+
+            for stride_1 in [1, 2]:
+                config = dict(
+                    kernel_size=3,
+                    max_displacement=2,
+                    stride_1=stride_1,
+                    stride_2=1,
+                    pad=4,
+                    data_format=data_format)
+                input_a = tf.convert_to_tensor(val_a)
+                input_b = tf.convert_to_tensor(val_b)
+                results = []
+                for use_custom_op in [True, False]:
+                    layer = CorrelationCost(
+                        use_custom_op=use_custom_op, **config)
+                    with tf.GradientTape() as tape:
+                        tape.watch([input_a, input_b])
+                        output = layer([input_a, input_b], training=True)
+                        loss = tf.reduce_sum(output**2)
+                    grads = tape.gradient(loss, [input_a, input_b])
+                    results.append(self.evaluate([output] + grads))
+
+                for expected, actual in zip(*results):
+                    self.assertAllClose(actual, expected, rtol=1e-5, atol=1e-4)
+
+    def _factorized(self, data_format):
+        with test_utils.use_gpu():
+            val_a, val_b = self._create_test_data(data_format)
+            channel_axis = 1 if data_format == 'channels_first' else 3
+
+            for kernel_size, stride_1, stride_2 in [(1, 1, 1), (3, 2, 2)]:
+                config = dict(
+                    kernel_size=kernel_size,
+                    max_displacement=2,
+                    stride_1=stride_1,
+                    stride_2=stride_2,
+                    pad=4,
+                    data_format=data_format)
+                layer = CorrelationCost(factorized=True, **config)
+                actual = layer([val_a, val_b])
+
+                # The strips are the center row and column of the window.
+                full = _correlation_cost(val_a, val_b, **config)
+                r = 2 // stride_2
+                d = 2 * r + 1
+                row = [r * d + i for i in range(d)]
+                column = [j * d + r for j in range(d)]
+                expected = tf.gather(full, row + column, axis=channel_axis)
+
+                self.assertAllClose(actual, expected)
+                self.assertEqual(
+                    tuple(actual.shape),
+                    layer.compute_output_shape([val_a.shape, val_b.shape])[0])
+
+    def _quantized(self, data_format):
+        # The rows of a patch are not a multiple of the SIMD width.
+        val_a = np.random.randn(2, 6, 7, 40).astype(np.float32)
+        val_b = np.random.randn(2, 6, 7, 40).astype(np.float32)
+        if data_format == 'channels_first':
+            val_a = np.transpose(val_a, [0, 3, 1, 2])
+            val_b = np.transpose(val_b, [0, 3, 1, 2])
+
+        for kernel_size, stride_1 in [(1, 1), (3, 1), (1, 2)]:
+            config = dict(
+                kernel_size=kernel_size,
+                max_displacement=2,
+                stride_1=stride_1,
+                stride_2=1,
+                pad=2,
+                data_format=data_format)
+            layer = CorrelationCost(dtype='int8', **config)
+            actual = layer([val_a, val_b])
+
+            # The quantized op computes the exact costs of the dequantized
+            # inputs.
+            quantized_a, scale_a = _quantize(val_a)
+            quantized_b, scale_b = _quantize(val_b)
+            expected = _correlation_cost(
+                tf.cast(quantized_a, tf.float32) * scale_a,
+                tf.cast(quantized_b, tf.float32) * scale_b, **config)
+
+            self.assertEqual(actual.dtype, tf.float32)
+            self.assertAllClose(actual, expected, rtol=1e-5, atol=1e-5)
+            self.assertEqual(layer.get_config()['dtype'], 'int8')
+
     def _keras(self, data_format):
         # Unable to use `layer_test` as this layer has multiple inputs.
         with test_utils.use_gpu():
@@ -188,6 +350,112 @@ class CorrelationCostTest(tf.test.TestCase):
     def testBackwardNHWC(self):
         self._gradients(data_format='channels_last')
 
+    def testBackwardFusedNCHW(self):
+        self._gradients(data_format='channels_first', training=True)
+
+    def testBackwardFusedNHWC(self):
+        self._gradients(data_format='channels_last', training=True)
+
+    def testHalfPrecisionNCHW(self):
+        self._half_precision(data_format='channels_first')
+
+    def testHalfPrecisionNHWC(self):
+        self._half_precision(data_format='channels_last')
+
+    def testMatmulNCHW(self):
+        self._matmul(data_format='channels_first')
+
+    def testMatmulNHWC(self):
+        self._matmul(data_format='channels_last')
+
+    def testPureTFNCHW(self):
+        self._pure_tf(data_format='channels_first')
+
+    def testPureTFNHWC(self):
+        self._pure_tf(data_format='channels_last')
+
+    def testFactorizedNCHW(self):
+        self._factorized(data_format='channels_first')
+
+    def testFactorizedNHWC(self):
+        self._factorized(data_format='channels_last')
+
+    def testQuantizedInvalidConfig(self):
+        config = dict(
+            kernel_size=1,
+            max_displacement=2,
+            stride_1=1,
+            stride_2=1,
+            pad=2,
+            data_format='channels_last',
+            dtype='int8')
+        with self.assertRaises(ValueError):
+            CorrelationCost(use_custom_op=False, **config)
+        with self.assertRaises(ValueError):
+            CorrelationCost(factorized=True, **config)
+
+    def testQuantizedNCHW(self):
+        self._quantized(data_format='channels_first')
+
+    def testQuantizedNHWC(self):
+        self._quantized(data_format='channels_last')
+
+    def testOutputShapeCache(self):
+        layer = CorrelationCost(
+            kernel_size=1,
+            max_displacement=2,
+            stride_1=1,
+            stride_2=2,
+            pad=4,
+            data_format='channels_last')
+        input_shape = [(None, 7, 8, 3), (None, 7, 8, 3)]
+
+        expected = [(None, 11, 12, 9)]
+        self.assertEqual(layer.compute_output_shape(input_shape), expected)
+        self.assertEqual(layer.compute_output_shape(input_shape), expected)
+        self.assertEqual(len(layer._shape_cache), 1)
+
+        # pad == max_displacement and kernel_size == 1 keep H and W.
+        layer = CorrelationCost(
+            kernel_size=1,
+            max_displacement=4,
+            stride_1=1,
+            stride_2=2,
+            pad=4,
+            data_format='channels_first')
+        self.assertEqual(
+            layer.compute_output_shape([(2, 3, 7, None), (2, 3, 7, None)]),
+            [(2, 25, 7, None)])
+
+        # The cache must not break checkpointing.
+        tf.train.Checkpoint(layer=layer).save(self.get_temp_dir() + '/ckpt')
+
+    def testOutputShapeMatchesOp(self):
+        for kernel_size, max_displacement, stride_1, pad in [(1, 2, 2, 2),
+                                                             (3, 2, 3, 1),
+                                                             (1, 4, 2, 4)]:
+            config = dict(
+                kernel_size=kernel_size,
+                max_displacement=max_displacement,
+                stride_1=stride_1,
+                stride_2=2,
+                pad=pad,
+                data_format='channels_last')
+            layer = CorrelationCost(**config)
+            input_shape = [None, 9, 10, 3]
+
+            @tf.function(input_signature=[
+                tf.TensorSpec(input_shape),
+                tf.TensorSpec(input_shape)
+            ])
+            def fn(input_a, input_b):
+                return _correlation_cost(input_a, input_b, **config)
+
+            output = fn.get_concrete_function().structured_outputs
+            self.assertEqual(
+                layer.compute_output_shape([input_shape, input_shape]),
+                [tuple(output.shape.as_list())])
+
     def testKerasNCHW(self):
         self._keras(data_format='channels_first')
 